@@ -0,0 +1,143 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+SESSION_DAYS = 30
+CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '60'))
+CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '1000'))
+REVOCATION_CHECK = float(os.environ.get('SESSION_REVOCATION_CHECK', '2'))
+PURGE_CHUNK = int(os.environ.get('SESSION_PURGE_CHUNK', '1000'))
+PURGE_INTERVAL = float(os.environ.get('SESSION_PURGE_INTERVAL', '600'))
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_last_purge = 0.0
+_version = (None, 0.0)
+
+
+def generate_token():
+    return secrets.token_hex(32)
+
+
+def hash_token(token):
+    """В БД хранится только sha256 токена (32 байта bytea) — индекс узкий, утечка таблицы не раскрывает сессии"""
+    return hashlib.sha256(token.encode()).digest()
+
+
+def revocation_version(cur):
+    """Версию увеличивают logout и toggle_admin (nextval). Экземпляр перечитывает её не чаще раза в
+    SESSION_REVOCATION_CHECK секунд: попадание в кэш обычно обходится без запроса к БД, а отозванная
+    сессия на других экземплярах перестаёт действовать не позже чем через эти секунды"""
+    global _version
+    version, checked_at = _version
+    if version is not None and time.monotonic() - checked_at < REVOCATION_CHECK:
+        return version
+    cur.execute("SELECT last_value FROM panel_sessions_version_seq")
+    version = cur.fetchone()[0]
+    _version = (version, time.monotonic())
+    return version
+
+
+def revoke(cur):
+    """Вызывать после COMMIT: nextval виден сразу, иначе другой экземпляр успеет закэшировать ещё живую сессию"""
+    global _version
+    cur.execute("SELECT nextval('panel_sessions_version_seq')")
+    _version = (None, 0.0)
+
+
+def cache_get(key, version):
+    with _lock:
+        item = _cache.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.monotonic() or item[2] != version:
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return item[0]
+
+
+def cache_put(key, user, expires_at, version):
+    ttl = min(CACHE_TTL, (expires_at - datetime.utcnow()).total_seconds())
+    if ttl <= 0:
+        return
+    with _lock:
+        _cache[key] = (user, time.monotonic() + ttl, version)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def forget_token(token):
+    with _lock:
+        _cache.pop(hash_token(token), None)
+
+
+def forget_user(user_id):
+    with _lock:
+        for key in [k for k, item in _cache.items() if item[0]['id'] == user_id]:
+            del _cache[key]
+
+
+def get_user_by_token(cur, token):
+    if not token:
+        return None
+    key = hash_token(token)
+    version = revocation_version(cur)
+    user = cache_get(key, version)
+    if user is not None:
+        return dict(user)
+    cur.execute("""
+        SELECT pu.id, pu.login, pu.display_name, pu.role, pu.is_active, ps.expires_at
+        FROM panel_sessions ps
+        JOIN panel_users pu ON ps.user_id = pu.id
+        WHERE ps.token_hash = %s AND ps.expires_at > NOW() AND pu.is_active = TRUE
+    """, (key,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    user = {'id': row[0], 'login': row[1], 'displayName': row[2], 'role': row[3], 'isActive': row[4]}
+    cache_put(key, user, row[5], version)
+    return dict(user)
+
+
+def create_session(cur, user_id):
+    token = generate_token()
+    cur.execute(
+        "INSERT INTO panel_sessions (user_id, token_hash, expires_at) VALUES (%s, %s, %s)",
+        (user_id, hash_token(token), datetime.utcnow() + timedelta(days=SESSION_DAYS))
+    )
+    return token
+
+
+def end_session(cur, token):
+    forget_token(token)
+    cur.execute("DELETE FROM panel_sessions WHERE token_hash = %s", (hash_token(token),))
+
+
+def purge_expired(conn, cur, max_chunks=None):
+    """Удаляет истёкшие сессии порциями по PURGE_CHUNK строк, каждая порция — отдельная транзакция"""
+    global _last_purge
+    _last_purge = time.monotonic()
+    deleted = 0
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        cur.execute("""
+            DELETE FROM panel_sessions WHERE id IN (
+                SELECT id FROM panel_sessions WHERE expires_at <= NOW() LIMIT %s
+            )
+        """, (PURGE_CHUNK,))
+        conn.commit()
+        deleted += cur.rowcount
+        chunks += 1
+        if cur.rowcount < PURGE_CHUNK:
+            break
+    return deleted
+
+
+def purge_due():
+    return time.monotonic() - _last_purge >= PURGE_INTERVAL
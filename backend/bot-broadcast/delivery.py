@@ -0,0 +1,168 @@
+import os
+from psycopg2.extras import execute_values
+from sender import PERMANENT
+
+CHUNK_SIZE = int(os.environ.get('BROADCAST_CHUNK_SIZE', '1000'))
+LEASE_SECONDS = int(os.environ.get('BROADCAST_LEASE_SECONDS', '90'))
+
+
+def recipients_sql(segment_id):
+    if segment_id:
+        return ("SELECT s.telegram_id FROM bot_segment_members s "
+                "JOIN bot_users u ON u.telegram_id = s.telegram_id AND u.is_blocked = FALSE AND u.unreachable_at IS NULL "
+                "WHERE s.segment_id = %(segment)s"), {'segment': segment_id}
+    return "SELECT u.telegram_id FROM bot_users u WHERE u.is_blocked = FALSE AND u.unreachable_at IS NULL", {}
+
+
+def enqueue(cur, broadcast_id, segment_id, after_id=0):
+    """Делит получателей на диапазоны telegram_id по CHUNK_SIZE человек; возвращает число получателей"""
+    recipients, args = recipients_sql(segment_id)
+    cur.execute(f"""
+        WITH ranges AS (
+            INSERT INTO bot_broadcast_queue (broadcast_id, range_start, range_end, recipients)
+            SELECT %(broadcast)s, MIN(telegram_id), MAX(telegram_id), COUNT(*)
+            FROM (
+                SELECT r.telegram_id, (ROW_NUMBER() OVER (ORDER BY r.telegram_id) - 1) / %(chunk)s AS bucket
+                FROM ({recipients}) r
+                WHERE r.telegram_id > %(after)s
+            ) numbered
+            GROUP BY bucket
+            RETURNING recipients
+        )
+        SELECT COALESCE(SUM(recipients), 0) FROM ranges
+    """, dict(args, broadcast=broadcast_id, chunk=CHUNK_SIZE, after=after_id or 0))
+    return cur.fetchone()[0]
+
+
+def has_queue(cur, broadcast_id):
+    cur.execute("SELECT EXISTS (SELECT 1 FROM bot_broadcast_queue WHERE broadcast_id = %s)", (broadcast_id,))
+    return cur.fetchone()[0]
+
+
+def claim_range(conn, cur, broadcast_id):
+    """Берёт свободный диапазон (или диапазон с истёкшей арендой) через SKIP LOCKED — экземпляры не ждут друг друга.
+    (range_start, range_end, claimed_at, done_through, active): done_through — последний telegram_id, до которого
+    диапазон уже отправлен, или None; active — сколько аренд сейчас делят общий лимит bot_rate_limits"""
+    cur.execute("""
+        UPDATE bot_broadcast_queue q SET status = 'sending', claimed_at = clock_timestamp()
+        FROM (
+            SELECT broadcast_id, range_start FROM bot_broadcast_queue
+            WHERE broadcast_id = %s
+              AND (status = 'pending' OR (status = 'sending' AND claimed_at < NOW() - make_interval(secs => %s)))
+            ORDER BY range_start
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        ) c
+        WHERE q.broadcast_id = c.broadcast_id AND q.range_start = c.range_start
+        RETURNING q.range_start, q.range_end, q.claimed_at, q.done_through
+    """, (broadcast_id, LEASE_SECONDS))
+    row = cur.fetchone()
+    if row is not None:
+        cur.execute("""
+            SELECT COUNT(*) FROM bot_broadcast_queue
+            WHERE status = 'sending' AND claimed_at >= NOW() - make_interval(secs => %s)
+        """, (LEASE_SECONDS,))
+        row = tuple(row) + (cur.fetchone()[0],)
+    conn.commit()
+    return row
+
+
+def fetch_range(cur, segment_id, after, range_end, limit):
+    """Следующие limit получателей диапазона после telegram_id after"""
+    recipients, args = recipients_sql(segment_id)
+    cur.execute(
+        f"SELECT r.telegram_id FROM ({recipients}) r WHERE r.telegram_id > %(after)s AND r.telegram_id <= %(end)s "
+        f"ORDER BY r.telegram_id LIMIT %(limit)s",
+        dict(args, after=after, end=range_end, limit=limit)
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def record_failures(cur, broadcast_id, failures):
+    """Неудачи пишутся в bot_broadcast_failures; постоянно недоступные получатели помечаются в bot_users"""
+    execute_values(
+        cur,
+        """INSERT INTO bot_broadcast_failures (broadcast_id, telegram_id, reason, error_code) VALUES %s
+        ON CONFLICT (broadcast_id, telegram_id) DO UPDATE SET reason = EXCLUDED.reason, error_code = EXCLUDED.error_code""",
+        [(broadcast_id, chat_id, reason, status) for chat_id, reason, status in failures], page_size=len(failures)
+    )
+    unreachable = [(chat_id, reason) for chat_id, reason, _ in failures if reason in PERMANENT]
+    if unreachable:
+        execute_values(
+            cur,
+            """UPDATE bot_users u SET unreachable_at = NOW(), unreachable_reason = v.reason
+            FROM (VALUES %s) AS v(telegram_id, reason)
+            WHERE u.telegram_id = v.telegram_id AND u.unreachable_at IS NULL""",
+            unreachable, template='(%s::bigint, %s::varchar)', page_size=len(unreachable)
+        )
+
+
+def record_progress(conn, cur, broadcast_id, range_start, claimed_at, through, sent, failures, finished):
+    """Сдвигает done_through диапазона до through и прибавляет счётчики рассылки в одной транзакции;
+    finished закрывает диапазон. Заодно продлевает аренду: возвращает новое claimed_at,
+    а если аренду перехватили — None, и ничего не меняется"""
+    failed = len(failures)
+    cur.execute("""
+        WITH step AS (
+            UPDATE bot_broadcast_queue SET
+                status = CASE WHEN %(finished)s THEN 'done' ELSE status END,
+                claimed_at = clock_timestamp(),
+                done_through = COALESCE(%(through)s, done_through),
+                sent = sent + %(sent)s,
+                failed = failed + %(failed)s
+            WHERE broadcast_id = %(broadcast)s AND range_start = %(start)s AND claimed_at = %(claimed)s AND status = 'sending'
+            RETURNING range_end, claimed_at
+        ), counted AS (
+            UPDATE bot_broadcasts SET
+                sent_count = sent_count + %(sent)s,
+                failed_count = failed_count + %(failed)s,
+                last_telegram_id = CASE WHEN %(finished)s THEN GREATEST(last_telegram_id, (SELECT range_end FROM step))
+                                        ELSE last_telegram_id END,
+                updated_at = NOW()
+            WHERE id = %(broadcast)s AND EXISTS (SELECT 1 FROM step)
+        )
+        SELECT claimed_at FROM step
+    """, {'broadcast': broadcast_id, 'start': range_start, 'claimed': claimed_at, 'through': through,
+          'sent': sent, 'failed': failed, 'finished': finished})
+    row = cur.fetchone()
+    if row is not None and failures:
+        record_failures(cur, broadcast_id, failures)
+    conn.commit()
+    return row[0] if row is not None else None
+
+
+def release_range(conn, cur, broadcast_id, range_start, claimed_at):
+    """Возвращает диапазон в очередь, не трогая счётчики и done_through, — если время вышло или отправка оборвалась"""
+    conn.rollback()
+    cur.execute("""
+        UPDATE bot_broadcast_queue SET status = 'pending', claimed_at = NULL
+        WHERE broadcast_id = %s AND range_start = %s AND claimed_at = %s AND status = 'sending'
+    """, (broadcast_id, range_start, claimed_at))
+    conn.commit()
+
+
+def finish_if_complete(conn, cur, broadcast_id):
+    """'done', когда закрыты все диапазоны; иначе 'sending' — остаток доотправляют другие экземпляры"""
+    cur.execute("""
+        UPDATE bot_broadcasts SET status = 'done', updated_at = NOW(), finished_at = NOW()
+        WHERE id = %s AND status <> 'done'
+          AND NOT EXISTS (SELECT 1 FROM bot_broadcast_queue WHERE broadcast_id = %s AND status <> 'done')
+    """, (broadcast_id, broadcast_id))
+    conn.commit()
+    cur.execute("SELECT status FROM bot_broadcasts WHERE id = %s", (broadcast_id,))
+    return cur.fetchone()[0]
+
+
+def pause_if_idle(conn, cur, broadcast_id):
+    """Бюджет времени вышел: рассылка становится 'paused', только если никто больше не держит аренду"""
+    cur.execute("""
+        UPDATE bot_broadcasts SET status = 'paused', updated_at = NOW()
+        WHERE id = %s AND status = 'sending'
+          AND NOT EXISTS (
+              SELECT 1 FROM bot_broadcast_queue
+              WHERE broadcast_id = %s AND status = 'sending' AND claimed_at >= NOW() - make_interval(secs => %s)
+          )
+    """, (broadcast_id, broadcast_id, LEASE_SECONDS))
+    conn.commit()
+    cur.execute("SELECT status FROM bot_broadcasts WHERE id = %s", (broadcast_id,))
+    return cur.fetchone()[0]
@@ -1,86 +1,215 @@
 import json
 import os
-import psycopg2
-import urllib.request
+import time
+from db import connection
+from delivery import CHUNK_SIZE, LEASE_SECONDS, claim_range, enqueue, fetch_range, finish_if_complete, has_queue, pause_if_idle, record_progress, release_range
+from ratelimit import DbRateLimiter
+from segments import materialize_segment, preview_segment
+from sender import BroadcastSender, GLOBAL_RATE, SendAborted
+from tracing import traced
 
+TIME_BUDGET = float(os.environ.get('BROADCAST_TIME_BUDGET', '50'))
+SAFETY_SECONDS = 5
+
+
+def remaining_seconds(context, started):
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        return context.get_remaining_time_in_millis() / 1000.0
+    return TIME_BUDGET - (time.monotonic() - started)
+
+
+def step_size(rate, seconds):
+    """Сколько получателей успеть отправить за seconds при скорости rate — от 1 до CHUNK_SIZE"""
+    return max(1, min(CHUNK_SIZE, int(rate * seconds)))
+
+
+def run_job(conn, cur, broadcast_id, text, segment_id, token, context, started):
+    """Рабочий цикл экземпляра: берёт диапазоны получателей из bot_broadcast_queue, пока есть время.
+    Диапазон отправляется шагами, размер шага — по оставшемуся времени и скорости экземпляра (его доля общего лимита,
+    затем измеренная), но не дольше трети аренды. После каждого шага прогресс фиксируется и аренда продлевается,
+    поэтому каждый вызов продвигает рассылку хотя бы на одного получателя, а диапазон не перехватывают посреди отправки.
+    Параллельные вызовы с тем же broadcastId делят очередь и общий лимит bot_rate_limits"""
+    limiter = DbRateLimiter('telegram', GLOBAL_RATE)
+    sender = BroadcastSender(token, bucket=limiter)
+    rate = GLOBAL_RATE
+    progressed = False
+
+    try:
+        while True:
+            seconds = remaining_seconds(context, started) - SAFETY_SECONDS
+            if progressed and seconds * rate < 1:
+                return pause_if_idle(conn, cur, broadcast_id)
+            claim = claim_range(conn, cur, broadcast_id)
+            if claim is None:
+                return finish_if_complete(conn, cur, broadcast_id)
+            range_start, range_end, claimed_at, done_through, active = claim
+            after = range_start - 1 if done_through is None else done_through
+            rate = min(rate, GLOBAL_RATE / max(1, active))
+
+            while True:
+                limit = step_size(rate, min(seconds, LEASE_SECONDS / 3))
+                chunk = fetch_range(cur, segment_id, after, range_end, limit)
+                conn.commit()
+                sent, failures = 0, []
+                if chunk:
+                    step_started = time.monotonic()
+                    try:
+                        sent, failures = sender.send(chunk, text)
+                    except SendAborted as e:
+                        through = chunk[e.attempted - 1] if e.attempted else None
+                        claimed_at = record_progress(conn, cur, broadcast_id, range_start, claimed_at, through, e.sent, e.failures, False)
+                        if claimed_at is not None:
+                            release_range(conn, cur, broadcast_id, range_start, claimed_at)
+                        raise e.error
+                    except Exception:
+                        release_range(conn, cur, broadcast_id, range_start, claimed_at)
+                        raise
+                    rate = min(GLOBAL_RATE, len(chunk) / max(time.monotonic() - step_started, 0.001))
+                    after = chunk[-1]
+                finished = len(chunk) < limit or after >= range_end
+                claimed_at = record_progress(conn, cur, broadcast_id, range_start, claimed_at, after, sent, failures, finished)
+                if claimed_at is None:
+                    break
+                progressed = True
+                if finished:
+                    break
+                seconds = remaining_seconds(context, started) - SAFETY_SECONDS
+                if seconds * rate < 1:
+                    release_range(conn, cur, broadcast_id, range_start, claimed_at)
+                    break
+    finally:
+        limiter.close()
+
+
+def failure_breakdown(cur, broadcast_ids):
+    """{broadcastId: {причина: число}} по bot_broadcast_failures"""
+    breakdown = {broadcast_id: {} for broadcast_id in broadcast_ids}
+    if not broadcast_ids:
+        return breakdown
+    cur.execute(
+        """SELECT broadcast_id, reason, COUNT(*) FROM bot_broadcast_failures
+        WHERE broadcast_id = ANY(%s) GROUP BY broadcast_id, reason""",
+        (list(broadcast_ids),)
+    )
+    for broadcast_id, reason, count in cur.fetchall():
+        breakdown[broadcast_id][reason] = count
+    return breakdown
+
+
+def broadcast_summary(cur, broadcast_id, status):
+    cur.execute("SELECT sent_count, failed_count, total_count FROM bot_broadcasts WHERE id = %s", (broadcast_id,))
+    sent, failed, total = cur.fetchone()
+    return {
+        'broadcastId': broadcast_id,
+        'sentCount': sent,
+        'failedCount': failed,
+        'totalCount': total,
+        'failures': failure_breakdown(cur, [broadcast_id])[broadcast_id],
+        'status': status
+    }
+
+
+@traced('bot-broadcast')
 def handler(event, context):
     """Рассылка сообщений пользователям бота и получение истории рассылок"""
 
     if event.get('httpMethod') == 'OPTIONS':
         return {'statusCode': 200, 'headers': {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type', 'Access-Control-Max-Age': '86400'}, 'body': ''}
 
+    started = time.monotonic()
     headers = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
     token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
 
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-
-    if event.get('httpMethod') == 'GET':
-        cur.execute("SELECT id, text, sent_count, failed_count, status, created_at FROM bot_broadcasts ORDER BY created_at DESC LIMIT 20")
-        broadcasts = []
-        for row in cur.fetchall():
-            broadcasts.append({
-                'id': row[0],
-                'text': row[1],
-                'sentCount': row[2],
-                'failedCount': row[3],
-                'status': row[4],
-                'createdAt': row[5].isoformat()
-            })
-        cur.close()
-        conn.close()
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'broadcasts': broadcasts})}
+    if event.get('httpMethod') not in ('GET', 'POST'):
+        return {'statusCode': 405, 'headers': headers, 'body': json.dumps({'error': 'Method not allowed'})}
+
+    action = (event.get('queryStringParameters') or {}).get('action', '')
+    if action == 'preview':
+        if event.get('httpMethod') != 'POST':
+            return {'statusCode': 405, 'headers': headers, 'body': json.dumps({'error': 'POST only'})}
+        body = json.loads(event.get('body', '{}'))
+        with connection() as conn, conn.cursor() as cur:
+            try:
+                preview = preview_segment(cur, body.get('segment') or {}, bool(body.get('exact')))
+            except ValueError as e:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+        return {'statusCode': 200, 'headers': headers, 'body': json.dumps(preview)}
 
     if event.get('httpMethod') == 'POST':
         body = json.loads(event.get('body', '{}'))
         text = body.get('text', '').strip()
+        resume_id = body.get('broadcastId')
 
-        if not text:
-            cur.close()
-            conn.close()
+        if not text and not resume_id:
             return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Текст сообщения обязателен'})}
 
         if not token:
-            cur.close()
-            conn.close()
             return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': 'Токен бота не настроен'})}
 
-        cur.execute("INSERT INTO bot_broadcasts (text, status) VALUES (%s, 'sending') RETURNING id", (text,))
-        broadcast_id = cur.fetchone()[0]
-        conn.commit()
+    with connection() as conn, conn.cursor() as cur:
+        if event.get('httpMethod') == 'GET':
+            cur.execute("""
+                SELECT id, text, sent_count, failed_count, status, created_at, total_count, last_telegram_id, updated_at, finished_at, segment_id
+                FROM bot_broadcasts ORDER BY created_at DESC LIMIT 20
+            """)
+            rows = cur.fetchall()
+            failures = failure_breakdown(cur, [row[0] for row in rows])
+            broadcasts = []
+            for row in rows:
+                processed = row[2] + row[3]
+                broadcasts.append({
+                    'id': row[0],
+                    'text': row[1],
+                    'sentCount': row[2],
+                    'failedCount': row[3],
+                    'status': row[4],
+                    'createdAt': row[5].isoformat(),
+                    'totalCount': row[6],
+                    'progress': round(processed * 100 / row[6]) if row[6] else (100 if row[4] == 'done' else 0),
+                    'lastTelegramId': row[7],
+                    'updatedAt': row[8].isoformat() if row[8] else None,
+                    'finishedAt': row[9].isoformat() if row[9] else None,
+                    'segmentId': row[10],
+                    'failures': failures[row[0]]
+                })
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'broadcasts': broadcasts})}
 
-        cur.execute("SELECT telegram_id FROM bot_users WHERE is_blocked = FALSE")
-        users = [row[0] for row in cur.fetchall()]
+        if resume_id:
+            cur.execute(
+                """UPDATE bot_broadcasts SET status = 'sending', updated_at = NOW()
+                WHERE id = %s AND status IN ('paused', 'sending')
+                RETURNING id, text, last_telegram_id, segment_id""",
+                (resume_id,)
+            )
+            row = cur.fetchone()
+            if row and not has_queue(cur, resume_id):
+                enqueue(cur, resume_id, row[3], row[2])
+            conn.commit()
+            if not row:
+                cur.execute("SELECT status FROM bot_broadcasts WHERE id = %s", (resume_id,))
+                current = cur.fetchone()
+                if not current:
+                    return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': 'Рассылка не найдена'})}
+                return {'statusCode': 409, 'headers': headers, 'body': json.dumps({'error': 'Рассылка уже завершена', 'status': current[0]})}
+            broadcast_id, text, _, segment_id = row
+        else:
+            segment_id = None
+            if body.get('segment'):
+                try:
+                    segment_id, _ = materialize_segment(conn, cur, body['segment'])
+                except ValueError as e:
+                    return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+            cur.execute(
+                "INSERT INTO bot_broadcasts (text, status, segment_id) VALUES (%s, 'sending', %s) RETURNING id",
+                (text, segment_id)
+            )
+            broadcast_id = cur.fetchone()[0]
+            total = enqueue(cur, broadcast_id, segment_id)
+            cur.execute("UPDATE bot_broadcasts SET total_count = %s WHERE id = %s", (total, broadcast_id))
+            conn.commit()
 
-        sent = 0
-        failed = 0
+        status = run_job(conn, cur, broadcast_id, text, segment_id, token, context, started)
 
-        for user_id in users:
-            try:
-                payload = json.dumps({'chat_id': user_id, 'text': text, 'parse_mode': 'HTML'}).encode()
-                req = urllib.request.Request(
-                    f'https://api.telegram.org/bot{token}/sendMessage',
-                    data=payload,
-                    headers={'Content-Type': 'application/json'}
-                )
-                urllib.request.urlopen(req, timeout=10)
-                sent += 1
-            except Exception:
-                failed += 1
-
-        cur.execute(
-            "UPDATE bot_broadcasts SET sent_count = %s, failed_count = %s, status = 'done' WHERE id = %s",
-            (sent, failed, broadcast_id)
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({
-            'broadcastId': broadcast_id,
-            'sentCount': sent,
-            'failedCount': failed,
-            'status': 'done'
-        })}
-
-    return {'statusCode': 405, 'headers': headers, 'body': json.dumps({'error': 'Method not allowed'})}
+        result = broadcast_summary(cur, broadcast_id, status)
+
+        return {'statusCode': 200, 'headers': headers, 'body': json.dumps(result)}
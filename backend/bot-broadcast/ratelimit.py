@@ -0,0 +1,93 @@
+import math
+import os
+import threading
+import time
+import psycopg2
+from tracing import TracingCursor
+
+TAKE_SQL = """
+    INSERT INTO bot_rate_limits AS l (name, rate, tokens, updated_at)
+    VALUES (%(name)s, %(rate)s, %(rate)s, clock_timestamp())
+    ON CONFLICT (name) DO UPDATE SET
+        rate = EXCLUDED.rate,
+        tokens = CASE WHEN l.paused_until > clock_timestamp() THEN 0
+                      ELSE LEAST(EXCLUDED.rate, l.tokens + EXTRACT(EPOCH FROM clock_timestamp() - l.updated_at) * EXCLUDED.rate) END,
+        updated_at = clock_timestamp()
+    RETURNING tokens, COALESCE(EXTRACT(EPOCH FROM l.paused_until - clock_timestamp()), 0)
+"""
+
+
+class DbRateLimiter:
+    """Token bucket в bot_rate_limits, общий для всех экземпляров рассылки.
+    Токены берутся из БД блоками по block штук, чтобы не ходить в БД на каждое сообщение.
+    У лимитера одно своё соединение под self.lock — потоки рассылки не занимают пул (DB_POOL_MAX)"""
+
+    def __init__(self, name, rate, block=None):
+        self.name = name
+        self.rate = rate
+        self.block = block or max(1, int(rate / 4))
+        self.tokens = 0
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def transaction(self, work):
+        """work(cur) в одной транзакции на соединении лимитера; при обрыве — одна попытка с новым. Вызывать под self.lock"""
+        for attempt in range(2):
+            if self.conn is None or self.conn.closed:
+                self.conn = psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=TracingCursor)
+            try:
+                with self.conn.cursor() as cur:
+                    result = work(cur)
+                self.conn.commit()
+                return result
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.close()
+                if attempt:
+                    raise
+            except psycopg2.Error:
+                self.conn.rollback()
+                raise
+
+    def close(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+
+    def take(self, want):
+        def work(cur):
+            cur.execute(TAKE_SQL, {'name': self.name, 'rate': self.rate})
+            available, paused = cur.fetchone()
+            granted = min(want, math.floor(available))
+            if granted:
+                cur.execute("UPDATE bot_rate_limits SET tokens = tokens - %s WHERE name = %s", (granted, self.name))
+            return granted, available, paused
+
+        granted, available, paused = self.transaction(work)
+        if paused > 0:
+            return granted, paused
+        return granted, (1 - (available - granted)) / self.rate
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                if self.tokens > 0:
+                    self.tokens -= 1
+                    return
+                granted, wait = self.take(self.block)
+                if granted:
+                    self.tokens = granted - 1
+                    return
+            time.sleep(max(wait, 0.01))
+
+    def pause(self, seconds):
+        """429 от Telegram останавливает отправку во всех экземплярах"""
+        def work(cur):
+            cur.execute("""
+                UPDATE bot_rate_limits SET tokens = 0,
+                    paused_until = GREATEST(COALESCE(paused_until, clock_timestamp()), clock_timestamp() + make_interval(secs => %s))
+                WHERE name = %s
+            """, (seconds, self.name))
+
+        with self.lock:
+            self.tokens = 0
+            self.transaction(work)
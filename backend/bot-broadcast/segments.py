@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+SEGMENT_TTL = int(os.environ.get('SEGMENT_CACHE_TTL', '600'))
+SEGMENT_RETENTION_DAYS = 7
+SEGMENT_LOCK = 7304
+SEGMENT_KEYS = {'joinedAfter', 'joinedBefore', 'joinedWithinDays', 'activeWithinDays', 'inactiveForDays', 'commands', 'messages'}
+
+
+def fingerprint(spec):
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def days(value):
+    value = int(value)
+    if value <= 0:
+        raise ValueError('Число дней должно быть положительным')
+    return value
+
+
+def compile_segment(spec):
+    """JSON-фильтр сегмента → один SELECT telegram_id по bot_users u; неизвестные ключи — ошибка"""
+    if not isinstance(spec, dict):
+        raise ValueError('Сегмент должен быть объектом')
+    unknown = set(spec) - SEGMENT_KEYS
+    if unknown:
+        raise ValueError(f'Неизвестные условия сегмента: {", ".join(sorted(unknown))}')
+
+    ctes = []
+    joins = []
+    conditions = ['u.is_blocked = FALSE', 'u.unreachable_at IS NULL']
+    cte_args = []
+    args = []
+
+    if spec.get('joinedAfter'):
+        conditions.append('u.joined_at >= %s')
+        args.append(datetime.fromisoformat(spec['joinedAfter']))
+    if spec.get('joinedBefore'):
+        conditions.append('u.joined_at < %s')
+        args.append(datetime.fromisoformat(spec['joinedBefore']))
+    if spec.get('joinedWithinDays'):
+        conditions.append('u.joined_at >= NOW() - make_interval(days => %s)')
+        args.append(days(spec['joinedWithinDays']))
+    if spec.get('activeWithinDays'):
+        conditions.append('u.last_active_at >= NOW() - make_interval(days => %s)')
+        args.append(days(spec['activeWithinDays']))
+    if spec.get('inactiveForDays'):
+        conditions.append('u.last_active_at < NOW() - make_interval(days => %s)')
+        args.append(days(spec['inactiveForDays']))
+
+    commands = spec.get('commands') or {}
+    if commands:
+        window = ''
+        window_args = []
+        if commands.get('withinDays'):
+            window = ' AND c.created_at >= NOW() - make_interval(days => %s)'
+            window_args = [days(commands['withinDays'])]
+        if commands.get('any'):
+            conditions.append(f'u.telegram_id IN (SELECT c.telegram_id FROM bot_commands_log c WHERE c.command = ANY(%s){window})')
+            args += [list(commands['any'])] + window_args
+        if commands.get('none'):
+            conditions.append(f'u.telegram_id NOT IN (SELECT c.telegram_id FROM bot_commands_log c WHERE c.command = ANY(%s){window})')
+            args += [list(commands['none'])] + window_args
+
+    messages = spec.get('messages') or {}
+    if messages.get('min') is not None or messages.get('max') is not None:
+        count = 'u.messages_in'
+        if messages.get('withinDays'):
+            ctes.append("msg AS (SELECT m.telegram_id, COUNT(*) AS n FROM bot_messages m "
+                        "WHERE m.direction = 'in' AND m.created_at >= NOW() - make_interval(days => %s) GROUP BY m.telegram_id)")
+            cte_args.append(days(messages['withinDays']))
+            joins.append('LEFT JOIN msg ON msg.telegram_id = u.telegram_id')
+            count = 'COALESCE(msg.n, 0)'
+        if messages.get('min') is not None:
+            conditions.append(f'{count} >= %s')
+            args.append(int(messages['min']))
+        if messages.get('max') is not None:
+            conditions.append(f'{count} <= %s')
+            args.append(int(messages['max']))
+
+    query = ((f"WITH {', '.join(ctes)} " if ctes else '')
+             + 'SELECT u.telegram_id FROM bot_users u '
+             + ' '.join(joins)
+             + ' WHERE ' + ' AND '.join(conditions))
+    return query, cte_args + args
+
+
+def estimate_size(cur, query, args):
+    """Размер сегмента по плану запроса, без выполнения"""
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, args)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def fresh_segment(cur, key):
+    cur.execute(
+        """SELECT id, member_count FROM bot_segments
+        WHERE fingerprint = %s AND materialized_at > NOW() - make_interval(secs => %s)
+        ORDER BY materialized_at DESC LIMIT 1""",
+        (key, SEGMENT_TTL)
+    )
+    return cur.fetchone()
+
+
+def preview_segment(cur, spec, exact=False):
+    """Быстрая оценка: готовая материализация, иначе EXPLAIN; exact — COUNT(*) по тому же запросу"""
+    query, args = compile_segment(spec)
+    cached = fresh_segment(cur, fingerprint(spec))
+    if cached:
+        return {'count': cached[1], 'estimated': False, 'segmentId': cached[0]}
+    if exact:
+        cur.execute(f"SELECT COUNT(*) FROM ({query}) s", args)
+        return {'count': cur.fetchone()[0], 'estimated': False, 'segmentId': None}
+    return {'count': estimate_size(cur, query, args), 'estimated': True, 'segmentId': None}
+
+
+def purge_stale(cur):
+    """Удаляет давно не обновлявшиеся сегменты и вытесненные версии (старше двух SEGMENT_CACHE_TTL — их уже
+    не выдаёт fresh_segment), на которые не ссылаются незавершённые рассылки"""
+    cur.execute("""
+        WITH stale AS (
+            DELETE FROM bot_segments s
+            WHERE (s.materialized_at < NOW() - make_interval(days => %s)
+                   OR (s.materialized_at < NOW() - make_interval(secs => %s)
+                       AND EXISTS (SELECT 1 FROM bot_segments n WHERE n.fingerprint = s.fingerprint AND n.materialized_at > s.materialized_at)))
+              AND NOT EXISTS (SELECT 1 FROM bot_broadcasts b WHERE b.segment_id = s.id AND b.status IN ('sending', 'paused'))
+            RETURNING s.id
+        )
+        DELETE FROM bot_segment_members WHERE segment_id IN (SELECT id FROM stale)
+    """, (SEGMENT_RETENTION_DAYS, 2 * SEGMENT_TTL))
+
+
+def materialize_segment(conn, cur, spec):
+    """Состав сегмента в bot_segment_members; свежая материализация (SEGMENT_CACHE_TTL) переиспользуется рассылками.
+    Каждая материализация — новая строка bot_segments: состав, на который уже разложена очередь рассылки, не меняется"""
+    query, args = compile_segment(spec)
+    key = fingerprint(spec)
+    cached = fresh_segment(cur, key)
+    if cached:
+        return cached[0], cached[1]
+
+    cur.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", (SEGMENT_LOCK, key))
+    cached = fresh_segment(cur, key)
+    if cached:
+        conn.commit()
+        return cached[0], cached[1]
+
+    cur.execute("INSERT INTO bot_segments (fingerprint, definition) VALUES (%s, %s) RETURNING id",
+                (key, json.dumps(spec, ensure_ascii=False)))
+    segment_id = cur.fetchone()[0]
+    cur.execute(f"INSERT INTO bot_segment_members (segment_id, telegram_id) SELECT %s, s.telegram_id FROM ({query}) s",
+                [segment_id] + args)
+    member_count = cur.rowcount
+    cur.execute("UPDATE bot_segments SET member_count = %s, materialized_at = NOW() WHERE id = %s", (member_count, segment_id))
+    purge_stale(cur)
+    conn.commit()
+    return segment_id, member_count
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from telegram import TelegramClient, retry_after
+from tracing import attach, current
+
+WORKERS = int(os.environ.get('BROADCAST_WORKERS', '16'))
+GLOBAL_RATE = float(os.environ.get('BROADCAST_RATE', '30'))
+CHAT_RATE = float(os.environ.get('BROADCAST_CHAT_RATE', '1'))
+MAX_RETRIES = 3
+PERMANENT = {'blocked', 'deactivated', 'chat_not_found', 'forbidden'}
+
+
+def classify(status, data):
+    """Причина неудачи sendMessage; PERMANENT — получатель недоступен, повторять бессмысленно"""
+    description = (data.get('description') or '').lower()
+    if status == 403:
+        if 'blocked' in description:
+            return 'blocked'
+        if 'deactivated' in description:
+            return 'deactivated'
+        return 'forbidden'
+    if status == 400:
+        if 'chat not found' in description or 'peer_id_invalid' in description or 'user not found' in description:
+            return 'chat_not_found'
+        return 'bad_request'
+    if status == 429:
+        return 'rate_limited'
+    if status >= 500:
+        return 'server_error'
+    return 'error'
+
+
+class SendAborted(Exception):
+    """Все потоки рассылки упали: error — первая ошибка, sent/failures — итоги по первым attempted получателям чанка"""
+
+    def __init__(self, error, sent, failures, attempted):
+        super().__init__(str(error))
+        self.error = error
+        self.sent = sent
+        self.failures = failures
+        self.attempted = attempted
+
+
+class TokenBucket:
+    """Глобальный лимит отправки: rate токенов в секунду, burst не больше capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    self.updated = now
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class ChatLimiter:
+    """Минимальный интервал между сообщениями в один чат"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, chat_id):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at.get(chat_id, 0.0))
+            self.next_at[chat_id] = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class BroadcastSender:
+    """Параллельная рассылка через пул потоков с общим token bucket (локальным или DbRateLimiter) и учётом retry_after"""
+
+    def __init__(self, token, workers=None, rate=None, chat_rate=None, api_url=None, bucket=None):
+        self.token = token
+        self.workers = workers or WORKERS
+        self.bucket = bucket or TokenBucket(rate or GLOBAL_RATE)
+        self.chats = ChatLimiter(CHAT_RATE if chat_rate is None else chat_rate)
+        self.client = TelegramClient(token, api_url, retries=0)
+
+    def send_one(self, chat_id, text):
+        """(None, 200) при успехе, иначе (причина, HTTP-код последней попытки)"""
+        outcome = ('error', 0)
+        for _ in range(MAX_RETRIES + 1):
+            self.bucket.acquire()
+            self.chats.acquire(chat_id)
+            try:
+                status, data = self.client.call('sendMessage', {'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'})
+            except Exception:
+                return 'network', 0
+            if status == 200 and data.get('ok', False):
+                return None, status
+            outcome = (classify(status, data), status)
+            if status == 429:
+                self.bucket.pause(retry_after(data) or 1)
+                continue
+            if status >= 500:
+                continue
+            return outcome
+        return outcome
+
+    def send(self, chat_ids, text):
+        """(число отправленных, [(chat_id, причина, HTTP-код)] по неудачным).
+        Упавший поток сохраняет свои итоги, его чат считается неудачным ('error'), остальные потоки
+        дорабатывают общий итератор. Если все потоки упали и получатели остались — SendAborted с итогами
+        по уже взятым получателям: это всегда начало chat_ids"""
+        it = iter(chat_ids)
+        it_lock = threading.Lock()
+        taken = [0]
+        totals = {'sent': 0, 'failures': []}
+        totals_lock = threading.Lock()
+        trace = current()
+
+        def worker():
+            attach(trace)
+            sent = 0
+            failures = []
+            try:
+                while True:
+                    with it_lock:
+                        chat_id = next(it, None)
+                        taken[0] += chat_id is not None
+                    if chat_id is None:
+                        break
+                    try:
+                        reason, status = self.send_one(chat_id, text)
+                    except Exception:
+                        failures.append((chat_id, 'error', 0))
+                        raise
+                    if reason is None:
+                        sent += 1
+                    else:
+                        failures.append((chat_id, reason, status))
+            finally:
+                self.client.transport.reset()
+                with totals_lock:
+                    totals['sent'] += sent
+                    totals['failures'] += failures
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(worker) for _ in range(self.workers)]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            with it_lock:
+                left = next(it, None)
+            if left is not None:
+                raise SendAborted(errors[0], totals['sent'], totals['failures'], taken[0])
+
+        return totals['sent'], totals['failures']
@@ -0,0 +1,176 @@
+import asyncio
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+from tracing import span
+
+API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TIMEOUT = float(os.environ.get('TELEGRAM_TIMEOUT', '10'))
+MAX_RETRIES = int(os.environ.get('TELEGRAM_MAX_RETRIES', '3'))
+BACKOFF = float(os.environ.get('TELEGRAM_BACKOFF', '0.5'))
+MAX_RETRY_AFTER = 30
+GET_ME_TTL = float(os.environ.get('TELEGRAM_GETME_TTL', '300'))
+
+_transports = {}
+_transports_lock = threading.Lock()
+_get_me = {}
+
+
+class TelegramError(Exception):
+    def __init__(self, status, description, retry_after=None):
+        super().__init__(f'{status}: {description}')
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+
+
+class RequestNotSent(OSError):
+    """Запрос не ушёл в сокет (соединение не установлено или отвалилось до отправки) — повтор безопасен"""
+
+
+class Transport:
+    """Keep-alive соединение с Bot API, по одному на поток"""
+
+    def __init__(self, api_url=None, timeout=None):
+        parts = urlsplit(api_url or API_URL)
+        self.secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout or TIMEOUT
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def reset(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    def post(self, path, payload):
+        with span('http', path.rsplit('/', 1)[-1]):
+            return self.request(path, payload)
+
+    def request(self, path, payload):
+        """Повторяет только то, что Telegram точно не обработал: ошибку до отправки и закрытый сервером
+        keep-alive (RemoteDisconnected на переиспользованном сокете). Таймаут чтения не повторяется"""
+        body = json.dumps(payload).encode()
+        for attempt in range(2):
+            conn = self.connection()
+            reused = conn.sock is not None
+            try:
+                conn.request('POST', self.prefix + path, body=body, headers={'Content-Type': 'application/json'})
+            except (http.client.HTTPException, OSError) as e:
+                self.reset()
+                if attempt:
+                    raise RequestNotSent(str(e)) from e
+                continue
+            try:
+                resp = conn.getresponse()
+                data = resp.read()
+            except http.client.RemoteDisconnected:
+                self.reset()
+                if reused and not attempt:
+                    continue
+                raise
+            except (http.client.HTTPException, OSError):
+                self.reset()
+                raise
+            if resp.will_close:
+                self.reset()
+            try:
+                return resp.status, json.loads(data)
+            except ValueError:
+                return resp.status, {}
+
+
+def get_transport(api_url=None):
+    """Транспорт на уровне модуля: соединения переживают тёплые вызовы функции"""
+    key = api_url or API_URL
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = _transports[key] = Transport(key)
+    return transport
+
+
+def retry_after(data):
+    return (data.get('parameters') or {}).get('retry_after')
+
+
+class TelegramClient:
+    """Клиент Bot API: keep-alive, повторы на 429 (retry_after) и 5xx с экспоненциальной паузой"""
+
+    def __init__(self, token, api_url=None, retries=None):
+        self.token = token
+        self.transport = get_transport(api_url)
+        self.retries = MAX_RETRIES if retries is None else retries
+
+    def call(self, method, payload=None, retries=None):
+        """(status, data) последней попытки; сетевые ошибки после всех попыток пробрасываются.
+        Ошибка после отправки повторяется только для get*-методов: sendMessage мог дойти до пользователя"""
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            try:
+                status, data = self.transport.post(f'/bot{self.token}/{method}', payload or {})
+            except RequestNotSent:
+                if last:
+                    raise
+                time.sleep(BACKOFF * 2 ** attempt)
+                continue
+            except (http.client.HTTPException, OSError):
+                if last or not method.startswith('get'):
+                    raise
+                time.sleep(BACKOFF * 2 ** attempt)
+                continue
+            if last:
+                return status, data
+            if status == 429:
+                time.sleep(min(MAX_RETRY_AFTER, retry_after(data) or BACKOFF * 2 ** attempt))
+                continue
+            if status >= 500:
+                time.sleep(BACKOFF * 2 ** attempt)
+                continue
+            return status, data
+
+    def request(self, method, payload=None):
+        """result ответа Bot API или TelegramError"""
+        status, data = self.call(method, payload)
+        if status != 200 or not data.get('ok'):
+            raise TelegramError(status, data.get('description', 'Telegram API error'), retry_after(data))
+        return data.get('result')
+
+    def get_me(self):
+        """getMe кэшируется на GET_ME_TTL секунд — профиль бота меняется редко"""
+        cached = _get_me.get(self.token)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        result = self.request('getMe')
+        _get_me[self.token] = (result, time.monotonic() + GET_ME_TTL)
+        return result
+
+    def send_message(self, chat_id, text, parse_mode='HTML'):
+        return self.request('sendMessage', {'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode})
+
+    async def acall(self, method, payload=None, retries=None):
+        return await asyncio.to_thread(self.call, method, payload, retries)
+
+    async def arequest(self, method, payload=None):
+        return await asyncio.to_thread(self.request, method, payload)
+
+    async def aget_me(self):
+        return await asyncio.to_thread(self.get_me)
+
+    async def asend_message(self, chat_id, text, parse_mode='HTML'):
+        return await asyncio.to_thread(self.send_message, chat_id, text, parse_mode)
@@ -0,0 +1,47 @@
+from cursors import decode_cursor, encode_cursor
+from users import USER_COLUMNS, user_dict
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+RECENT_COMMANDS = 20
+
+
+def user_conversation(cur, params):
+    """Профиль пользователя: счётчики из bot_users, переписка по курсору и последние команды — всё по индексам (telegram_id, created_at)"""
+    telegram_id = int(params['telegram_id'])
+    limit = min(int(params.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+
+    cur.execute(f"SELECT {USER_COLUMNS} FROM bot_users WHERE telegram_id = %s", (telegram_id,))
+    user = cur.fetchone()
+    if not user:
+        return None
+
+    conditions = ['telegram_id = %s']
+    args = [telegram_id]
+    if params.get('cursor'):
+        created_at, row_id = decode_cursor(params['cursor'])
+        conditions.append('(created_at, id) < (%s, %s)')
+        args += [created_at, row_id]
+    cur.execute(
+        "SELECT id, direction, text, created_at FROM bot_messages WHERE " + ' AND '.join(conditions)
+        + " ORDER BY created_at DESC, id DESC LIMIT %s",
+        args + [limit + 1]
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    commands = []
+    if not params.get('cursor'):
+        cur.execute(
+            "SELECT command, created_at FROM bot_commands_log WHERE telegram_id = %s ORDER BY created_at DESC LIMIT %s",
+            (telegram_id, RECENT_COMMANDS)
+        )
+        commands = [{'command': row[0], 'createdAt': row[1].isoformat()} for row in cur.fetchall()]
+
+    return {
+        'user': user_dict(user),
+        'messages': [{'id': r[0], 'direction': r[1], 'text': r[2], 'createdAt': r[3].isoformat()} for r in rows],
+        'commands': commands,
+        'nextCursor': encode_cursor(rows[-1][3], rows[-1][0]) if has_more else None
+    }
@@ -0,0 +1,13 @@
+import base64
+from datetime import datetime
+
+
+def encode_cursor(value, row_id):
+    value = value.isoformat() if isinstance(value, datetime) else value
+    return base64.urlsafe_b64encode(f'{value}|{row_id}'.encode()).decode()
+
+
+def decode_cursor(cursor, parse=datetime.fromisoformat):
+    """Курсор keyset-пагинации: пара (ключ сортировки, id) последней отданной строки"""
+    value, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    return parse(value), int(row_id)
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from tracing import TracingCursor, span
+
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+IDLE_CHECK_SECONDS = float(os.environ.get('DB_IDLE_CHECK_SECONDS', '30'))
+
+_pool = None
+_pool_lock = threading.Lock()
+_released_at = {}
+
+
+def get_pool():
+    """Пул живёт на уровне модуля и переживает тёплые вызовы функции; соединения открываются по требованию"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(0, POOL_MAX, os.environ['DATABASE_URL'], cursor_factory=TracingCursor)
+    return _pool
+
+
+def is_alive(conn):
+    if conn.closed:
+        return False
+    released = _released_at.get(id(conn))
+    if released is None or time.monotonic() - released < IDLE_CHECK_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def acquire():
+    pool = get_pool()
+    for _ in range(POOL_MAX + 1):
+        conn = pool.getconn()
+        if is_alive(conn):
+            return conn
+        _released_at.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    return pool.getconn()
+
+
+def release(conn, broken=False):
+    pool = get_pool()
+    if not conn.closed and not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if conn.closed or broken:
+        _released_at.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        return
+    _released_at[id(conn)] = time.monotonic()
+    pool.putconn(conn)
+
+
+@contextmanager
+def connection():
+    """Соединение из пула; всегда возвращается обратно, незавершённая транзакция откатывается"""
+    with span('pool', 'acquire'):
+        conn = acquire()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        release(conn, broken)
@@ -1,18 +1,24 @@
 import json
 import os
-import psycopg2
-import urllib.request
-
+from conversation import user_conversation
+from db import connection
+from live import sse_body, wait_events
+from logs import export_logs, list_logs
+from moderation import MAX_IDS, active_broadcasts, block_filtered, block_ids, compile_filter, count_filtered, count_ids
+from settings import etag, read_settings, write_settings
+from telegram import TelegramClient
+from users import list_users
+from tracing import traced
+
+@traced('bot-manage')
 def handler(event, context):
     """Управление ботом — пользователи, настройки, модерация, информация о боте"""
 
     if event.get('httpMethod') == 'OPTIONS':
-        return {'statusCode': 200, 'headers': {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type', 'Access-Control-Max-Age': '86400'}, 'body': ''}
+        return {'statusCode': 200, 'headers': {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, Last-Event-ID', 'Access-Control-Max-Age': '86400'}, 'body': ''}
 
     headers = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
     token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
 
     params = event.get('queryStringParameters') or {}
     action = params.get('action', 'info')
@@ -20,151 +26,135 @@ def handler(event, context):
     if action == 'info':
         if token:
             try:
-                req = urllib.request.Request(f'https://api.telegram.org/bot{token}/getMe')
-                resp = urllib.request.urlopen(req, timeout=10)
-                bot_data = json.loads(resp.read())
-                bot_info = bot_data.get('result', {})
+                bot_info = TelegramClient(token).get_me() or {}
             except Exception:
                 bot_info = {'error': 'Не удалось подключиться к боту'}
         else:
             bot_info = {'error': 'Токен не настроен'}
 
-        cur.close()
-        conn.close()
         return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'bot': bot_info})}
 
-    if action == 'users':
-        page = int(params.get('page', '1'))
-        limit = 20
-        offset = (page - 1) * limit
-        search = params.get('search', '')
-
-        if search:
-            cur.execute(
-                "SELECT COUNT(*) FROM bot_users WHERE username ILIKE %s OR first_name ILIKE %s",
-                (f'%{search}%', f'%{search}%')
-            )
-        else:
-            cur.execute("SELECT COUNT(*) FROM bot_users")
-        total = cur.fetchone()[0]
-
-        if search:
-            cur.execute(
-                """SELECT telegram_id, username, first_name, last_name, is_blocked, joined_at, last_active_at
-                FROM bot_users WHERE username ILIKE %s OR first_name ILIKE %s
-                ORDER BY joined_at DESC LIMIT %s OFFSET %s""",
-                (f'%{search}%', f'%{search}%', limit, offset)
-            )
-        else:
-            cur.execute(
-                """SELECT telegram_id, username, first_name, last_name, is_blocked, joined_at, last_active_at
-                FROM bot_users ORDER BY joined_at DESC LIMIT %s OFFSET %s""",
-                (limit, offset)
-            )
-
-        users = []
-        for row in cur.fetchall():
-            users.append({
-                'telegramId': row[0],
-                'username': row[1],
-                'firstName': row[2],
-                'lastName': row[3],
-                'isBlocked': row[4],
-                'joinedAt': row[5].isoformat(),
-                'lastActiveAt': row[6].isoformat() if row[6] else None
-            })
-
-        cur.close()
-        conn.close()
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({
-            'users': users, 'total': total, 'page': page, 'pages': (total + limit - 1) // limit
-        })}
-
-    if action == 'block_user' and event.get('httpMethod') == 'POST':
-        body = json.loads(event.get('body', '{}'))
-        telegram_id = body.get('telegramId')
-        block = body.get('block', True)
-
-        cur.execute("UPDATE bot_users SET is_blocked = %s WHERE telegram_id = %s", (block, telegram_id))
-        conn.commit()
-        cur.close()
-        conn.close()
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'success': True})}
-
-    if action == 'settings':
-        if event.get('httpMethod') == 'GET':
-            cur.execute("SELECT key, value FROM bot_settings")
-            settings = {row[0]: row[1] for row in cur.fetchall()}
-            cur.close()
-            conn.close()
-            return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'settings': settings})}
-
-        if event.get('httpMethod') == 'POST':
+    if action == 'live':
+        request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        wait = float(params.get('wait', 25))
+        if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+            wait = min(wait, context.get_remaining_time_in_millis() / 1000.0 - 2)
+        result = wait_events(params.get('cursor') or request_headers.get('last-event-id'), wait)
+        if params.get('format') == 'sse' or 'text/event-stream' in request_headers.get('accept', ''):
+            return {'statusCode': 200, 'headers': dict(headers, **{'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'}),
+                    'body': sse_body(result)}
+        return {'statusCode': 200, 'headers': dict(headers, **{'Cache-Control': 'no-cache'}), 'body': json.dumps(result)}
+
+    with connection() as conn, conn.cursor() as cur:
+        if action == 'users':
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps(list_users(cur, params))}
+
+        if action == 'block_user' and event.get('httpMethod') == 'POST':
             body = json.loads(event.get('body', '{}'))
-            for key, value in body.items():
-                cur.execute(
-                    "INSERT INTO bot_settings (key, value, updated_at) VALUES (%s, %s, NOW()) ON CONFLICT (key) DO UPDATE SET value = %s, updated_at = NOW()",
-                    (key, str(value), str(value))
-                )
+            telegram_id = body.get('telegramId')
+            block = body.get('block', True)
+
+            cur.execute("UPDATE bot_users SET is_blocked = %s WHERE telegram_id = %s", (block, telegram_id))
             conn.commit()
-            cur.close()
-            conn.close()
+            cur.execute("SELECT nextval('bot_stats_version_seq')")
             return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'success': True})}
 
-    if action == 'logs':
-        cur.execute("""
-            SELECT m.id, m.telegram_id, u.username, u.first_name, m.direction, m.text, m.created_at
-            FROM bot_messages m
-            LEFT JOIN bot_users u ON m.telegram_id = u.telegram_id
-            ORDER BY m.created_at DESC LIMIT 50
-        """)
-        logs = []
-        for row in cur.fetchall():
-            logs.append({
-                'id': row[0],
-                'telegramId': row[1],
-                'username': row[2],
-                'firstName': row[3],
-                'direction': row[4],
-                'text': row[5],
-                'createdAt': row[6].isoformat()
-            })
-        cur.close()
-        conn.close()
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'logs': logs})}
-
-    if action == 'send_message' and event.get('httpMethod') == 'POST':
-        body = json.loads(event.get('body', '{}'))
-        chat_id = body.get('chatId')
-        text = body.get('text', '')
-
-        if not token or not chat_id or not text:
-            cur.close()
-            conn.close()
-            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Недостаточно данных'})}
-
-        try:
-            payload = json.dumps({'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'}).encode()
-            req = urllib.request.Request(
-                f'https://api.telegram.org/bot{token}/sendMessage',
-                data=payload,
-                headers={'Content-Type': 'application/json'}
-            )
-            resp = urllib.request.urlopen(req, timeout=10)
-            result = json.loads(resp.read())
-
-            cur.execute(
-                "INSERT INTO bot_messages (telegram_id, direction, text) VALUES (%s, 'out', %s)",
-                (chat_id, text)
-            )
-            conn.commit()
-        except Exception as e:
-            result = {'error': str(e)}
+        if action == 'bulk_block' and event.get('httpMethod') == 'POST':
+            body = json.loads(event.get('body', '{}'))
+            block = body.get('block', True)
+            telegram_ids = [int(tid) for tid in body.get('telegramIds', [])]
+
+            if len(telegram_ids) > MAX_IDS:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': f'Не больше {MAX_IDS} ID за запрос'})}
+
+            if telegram_ids:
+                if body.get('dryRun'):
+                    matched = count_ids(cur, telegram_ids)
+                    return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'matched': matched, 'dryRun': True})}
+                matched, affected, chunks = block_ids(conn, cur, telegram_ids, block)
+            else:
+                try:
+                    where, args = compile_filter(body.get('filter') or {})
+                except ValueError:
+                    return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Нужен список telegramIds или непустой filter'})}
+                if body.get('dryRun'):
+                    matched = count_filtered(cur, where, args)
+                    return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'matched': matched, 'dryRun': True})}
+                matched, affected, chunks = block_filtered(conn, cur, where, args, block)
+
+            cur.execute("SELECT nextval('bot_stats_version_seq')")
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps({
+                'success': True,
+                'matched': matched,
+                'affected': affected,
+                'chunks': chunks,
+                'activeBroadcasts': active_broadcasts(cur)
+            })}
+
+        if action == 'settings':
+            if event.get('httpMethod') == 'GET':
+                since = int(params['since']) if params.get('since') else None
+                settings, version = read_settings(cur, since)
+                tag = etag(version)
+                cache_headers = dict(headers, **{'ETag': tag, 'Cache-Control': 'no-cache', 'Access-Control-Expose-Headers': 'ETag'})
+                request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+                if request_headers.get('if-none-match') == tag:
+                    return {'statusCode': 304, 'headers': cache_headers, 'body': ''}
+                key = 'settings' if since is None else 'changed'
+                return {'statusCode': 200, 'headers': cache_headers, 'body': json.dumps({key: settings, 'version': version})}
+
+            if event.get('httpMethod') == 'POST':
+                body = json.loads(event.get('body', '{}'))
+                version, changed = write_settings(conn, cur, body)
+                return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'success': True, 'version': version, 'changed': changed})}
+
+        if action == 'conversation':
+            if not params.get('telegram_id'):
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Не указан telegram_id'})}
+            result = user_conversation(cur, params)
+            if result is None:
+                return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': 'Пользователь не найден'})}
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps(result)}
+
+        if action == 'logs':
+            if params.get('format') == 'ndjson':
+                body, count, next_cursor = export_logs(conn, params)
+                return {'statusCode': 200, 'headers': dict(headers, **{
+                    'Content-Type': 'application/x-ndjson',
+                    'X-Row-Count': str(count),
+                    'X-Next-Cursor': next_cursor or '',
+                    'Access-Control-Expose-Headers': 'X-Row-Count, X-Next-Cursor'
+                }), 'body': body}
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps(list_logs(cur, params))}
+
+        if action == 'send_message' and event.get('httpMethod') == 'POST':
+            body = json.loads(event.get('body', '{}'))
+            chat_id = body.get('chatId')
+            text = body.get('text', '')
+
+            if not token or not chat_id or not text:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Недостаточно данных'})}
+
+            try:
+                result = {'ok': True, 'result': TelegramClient(token).send_message(chat_id, text)}
+
+                cur.execute(
+                    "INSERT INTO bot_messages (telegram_id, direction, text) VALUES (%s, 'out', %s)",
+                    (chat_id, text)
+                )
+                cur.execute(
+                    """INSERT INTO bot_daily_stats (day, messages_out) VALUES (CURRENT_DATE, 1)
+                    ON CONFLICT (day) DO UPDATE SET messages_out = bot_daily_stats.messages_out + 1"""
+                )
+                cur.execute(
+                    "UPDATE bot_users SET messages_out = messages_out + 1, last_message_at = NOW() WHERE telegram_id = %s",
+                    (chat_id,)
+                )
+                conn.commit()
+                cur.execute("SELECT nextval('bot_stats_version_seq')")
+            except Exception as e:
+                result = {'error': str(e)}
 
-        cur.close()
-        conn.close()
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'result': result})}
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'result': result})}
 
-    cur.close()
-    conn.close()
-    return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Unknown action'})}
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Unknown action'})}
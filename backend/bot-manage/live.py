@@ -0,0 +1,219 @@
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from db import connection
+from logs import LOG_SELECT, log_dict
+
+CHANNEL = 'bot_live'
+BUFFER_SIZE = int(os.environ.get('LIVE_BUFFER_SIZE', '1000'))
+MAX_WAIT = float(os.environ.get('LIVE_MAX_WAIT', '25'))
+COALESCE_SECONDS = float(os.environ.get('LIVE_COALESCE_SECONDS', '0.2'))
+CATCH_UP_MAX = int(os.environ.get('LIVE_CATCH_UP_MAX', '10000'))
+LOG_LIMIT = 200
+
+POSITION_SQL = """
+    SELECT (SELECT COALESCE(MAX(id), 0) FROM bot_users),
+           (SELECT COALESCE(MAX(id), 0) FROM bot_messages),
+           (SELECT COALESCE(MAX(id), 0) FROM bot_commands_log)
+"""
+
+CHANGES_SQL = """
+    SELECT u.total, u.last, m.incoming, m.total - m.incoming, m.total, m.last, c.total, c.last
+    FROM (SELECT COUNT(*) AS total, MAX(id) AS last
+          FROM (SELECT id FROM bot_users WHERE id > %(users)s ORDER BY id LIMIT %(limit)s) t) u,
+         (SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE direction = 'in') AS incoming, MAX(id) AS last
+          FROM (SELECT id, direction FROM bot_messages WHERE id > %(messages)s ORDER BY id LIMIT %(limit)s) t) m,
+         (SELECT COUNT(*) AS total, MAX(id) AS last
+          FROM (SELECT id FROM bot_commands_log WHERE id > %(commands)s ORDER BY id LIMIT %(limit)s) t) c
+"""
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def encode_position(position):
+    return '.'.join(str(value) for value in position)
+
+
+def parse_position(cursor):
+    """Курсор — максимальные id bot_users, bot_messages и bot_commands_log, которые видела панель; None — не курсор"""
+    parts = (cursor or '').split('.')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+    return tuple(int(part) for part in parts)
+
+
+def current_position(cur):
+    cur.execute(POSITION_SQL)
+    return tuple(cur.fetchone())
+
+
+def read_changes(cur, position):
+    """Событие delta со всем, что записано после position, или None — изменений больше CATCH_UP_MAX,
+    дельту не собрать и панели нужен полный перезапрос. Логи — не больше LOG_LIMIT самых новых строк"""
+    cur.execute(CHANGES_SQL, {'users': position[0], 'messages': position[1], 'commands': position[2], 'limit': CATCH_UP_MAX})
+    users, users_last, messages_in, messages_out, messages, messages_last, commands, commands_last = cur.fetchone()
+    if max(users, messages, commands) >= CATCH_UP_MAX:
+        return None
+    logs = []
+    if messages:
+        cur.execute(LOG_SELECT + " WHERE m.id > %s AND m.id <= %s ORDER BY m.id DESC LIMIT %s",
+                    (position[1], messages_last, LOG_LIMIT))
+        logs = [log_dict(row) for row in cur.fetchall()]
+    return {
+        'type': 'delta',
+        'counters': {'users': users, 'messagesIn': messages_in, 'messagesOut': messages_out, 'commands': commands},
+        'logs': logs,
+        'refresh': messages > LOG_LIMIT,
+        'cursor': encode_position((users_last or position[0], messages_last or position[1], commands_last or position[2]))
+    }
+
+
+def has_changes(event):
+    return event['refresh'] or any(event['counters'].values())
+
+
+class LiveHub:
+    """Один LISTEN bot_live на экземпляр функции: уведомления вебхука будят хаб, он одним запросом на пачку
+    уведомлений читает изменения после своей позиции в БД и кладёт их в кольцевой буфер, общий для всех
+    ожидающих админов. Курсор строится из id строк в БД, поэтому его продолжает любой экземпляр"""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.events = deque(maxlen=BUFFER_SIZE)
+        self.cond = threading.Condition()
+        self.position = None
+        self.version = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def since(self, cursor):
+        """События буфера после cursor; None — курсора в буфере нет (выдан другим экземпляром или вытеснен)"""
+        with self.cond:
+            if self.position is not None and cursor == encode_position(self.position):
+                return []
+            for index, (start, _) in enumerate(self.events):
+                if start == cursor:
+                    return [event for _, event in list(self.events)[index:]]
+        return None
+
+    def wait(self, version, timeout):
+        """Ждёт нового события хаба не дольше timeout; возвращает текущую версию"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.version == version:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self.cond.wait(left)
+            return self.version
+
+    def publish(self, event):
+        with self.cond:
+            self.events.append((encode_position(self.position), event))
+            self.position = parse_position(event['cursor'])
+            self.version += 1
+            self.cond.notify_all()
+
+    def connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN {CHANNEL}')
+            if self.position is None:
+                with self.cond:
+                    self.position = current_position(cur)
+        return conn
+
+    def drain(self, conn):
+        """Пачка уведомлений — одно событие: изменения в БД после позиции хаба. Импорт или отставание больше
+        CATCH_UP_MAX строк — событие с refresh и переход на текущую позицию"""
+        time.sleep(COALESCE_SECONDS)
+        conn.poll()
+        imported = False
+        for notify in conn.notifies:
+            try:
+                imported = imported or bool(json.loads(notify.payload or '{}').get('import'))
+            except (ValueError, AttributeError):
+                pass
+        conn.notifies.clear()
+        with conn.cursor() as cur:
+            event = read_changes(cur, self.position)
+            if event is None:
+                event = {'type': 'delta', 'counters': dict.fromkeys(('users', 'messagesIn', 'messagesOut', 'commands'), 0),
+                         'logs': [], 'refresh': True, 'cursor': encode_position(current_position(cur))}
+        event['refresh'] = event['refresh'] or imported
+        if has_changes(event):
+            self.publish(event)
+
+    def run(self):
+        backoff = 1
+        while True:
+            try:
+                conn = self.connect()
+                backoff = 1
+                try:
+                    self.drain(conn)
+                    while True:
+                        if select.select([conn], [], [], 60)[0]:
+                            self.drain(conn)
+                        else:
+                            conn.poll()
+                finally:
+                    conn.close()
+            except (psycopg2.Error, OSError, ValueError):
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+def get_hub():
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                _hub = LiveHub(os.environ['DATABASE_URL'])
+    return _hub
+
+
+def wait_events(cursor, wait):
+    """{events, cursor, reset}. Курсор из буфера хаба отдаётся без запросов к БД; чужой или вытесненный курсор
+    дочитывается из БД одним запросом. reset — курсора нет или отставание больше CATCH_UP_MAX: панель перечитывает
+    bot-stats и логи и продолжает с нового курсора"""
+    hub = get_hub()
+    position = parse_position(cursor)
+    if position is None:
+        with connection() as conn, conn.cursor() as cur:
+            return {'events': [], 'cursor': encode_position(current_position(cur)), 'reset': True}
+
+    deadline = time.monotonic() + max(0.0, min(wait, MAX_WAIT))
+    version = hub.version
+    while True:
+        events = hub.since(cursor)
+        if events is None:
+            with connection() as conn, conn.cursor() as cur:
+                event = read_changes(cur, position)
+                if event is None:
+                    return {'events': [], 'cursor': encode_position(current_position(cur)), 'reset': True}
+            events = [event] if has_changes(event) else []
+        left = deadline - time.monotonic()
+        if events or left <= 0:
+            break
+        version = hub.wait(version, left)
+    return {'events': events, 'cursor': events[-1]['cursor'] if events else cursor, 'reset': False}
+
+
+def sse_body(result):
+    """Ответ в формате text/event-stream: EventSource переподключится сам и пришлёт Last-Event-ID"""
+    lines = ['retry: 1000']
+    if result['reset']:
+        lines += [f"id: {result['cursor']}", 'event: reset', 'data: {}', '']
+    for event in result['events']:
+        lines += [f"id: {event['cursor']}", 'event: delta', f'data: {json.dumps(event, ensure_ascii=False)}', '']
+    if not result['events'] and not result['reset']:
+        lines += [f"id: {result['cursor']}", ': keep-alive', '']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,110 @@
+import io
+import json
+from datetime import datetime
+from cursors import decode_cursor, encode_cursor
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_CHUNK = 10000
+
+LOG_SELECT = """
+    SELECT m.id, m.telegram_id, u.username, u.first_name, m.direction, m.text, m.created_at
+    FROM bot_messages m
+    LEFT JOIN bot_users u ON m.telegram_id = u.telegram_id
+"""
+
+
+def log_filters(params):
+    """Фильтры ленты: telegram_id, direction, интервал времени и полнотекстовый поиск по text"""
+    conditions = []
+    args = []
+    if params.get('telegram_id'):
+        conditions.append('m.telegram_id = %s')
+        args.append(int(params['telegram_id']))
+    if params.get('direction') in ('in', 'out'):
+        conditions.append('m.direction = %s')
+        args.append(params['direction'])
+    if params.get('from'):
+        conditions.append('m.created_at >= %s')
+        args.append(datetime.fromisoformat(params['from']))
+    if params.get('to'):
+        conditions.append('m.created_at < %s')
+        args.append(datetime.fromisoformat(params['to']))
+    if params.get('q'):
+        conditions.append("to_tsvector('simple', COALESCE(m.text, '')) @@ websearch_to_tsquery('simple', %s)")
+        args.append(params['q'])
+    return conditions, args
+
+
+def log_dict(row):
+    return {
+        'id': row[0],
+        'telegramId': row[1],
+        'username': row[2],
+        'firstName': row[3],
+        'direction': row[4],
+        'text': row[5],
+        'createdAt': row[6].isoformat()
+    }
+
+
+def build_query(params, limit):
+    conditions, args = log_filters(params)
+    tail = bool(params.get('after'))
+    if tail:
+        _, row_id = decode_cursor(params['after'])
+        conditions.append('m.id > %s')
+        args.append(row_id)
+    elif params.get('cursor'):
+        created_at, row_id = decode_cursor(params['cursor'])
+        conditions.append('(m.created_at, m.id) < (%s, %s)')
+        args += [created_at, row_id]
+    order = ' ORDER BY m.id ASC' if tail else ' ORDER BY m.created_at DESC, m.id DESC'
+    query = (LOG_SELECT
+             + (' WHERE ' + ' AND '.join(conditions) if conditions else '')
+             + order + ' LIMIT %s')
+    return query, args + [limit + 1], tail
+
+
+def list_logs(cur, params):
+    """Страница логов (новые сверху). cursor — следующая страница вглубь по created_at.
+    after — строки, записанные после курсора: ключ — m.id из последовательности, а не created_at,
+    потому что пачки и импорт приходят с ts клиента и могут оказаться «в прошлом»"""
+    limit = min(int(params.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    query, args, tail = build_query(params, limit)
+    cur.execute(query, args)
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if tail:
+        rows.reverse()
+
+    newest = max(rows, key=lambda row: row[0]) if rows else None
+    oldest = rows[-1] if rows else None
+    return {
+        'logs': [log_dict(row) for row in rows],
+        'nextCursor': encode_cursor(oldest[6], oldest[0]) if oldest and not tail and has_more else None,
+        'tailCursor': encode_cursor(newest[6], newest[0]) if newest else params.get('after') or None,
+        'hasMore': has_more
+    }
+
+
+def export_logs(conn, params):
+    """NDJSON-выгрузка порциями до EXPORT_CHUNK строк через серверный курсор; продолжение — по nextCursor"""
+    query, args, _ = build_query(dict(params, after=''), EXPORT_CHUNK)
+    out = io.StringIO()
+    count = 0
+    last = None
+    has_more = False
+    with conn.cursor(name='logs_export') as cur:
+        cur.itersize = 2000
+        cur.execute(query, args)
+        for row in cur:
+            if count == EXPORT_CHUNK:
+                has_more = True
+                break
+            out.write(json.dumps(log_dict(row), ensure_ascii=False))
+            out.write('\n')
+            count += 1
+            last = row
+    return out.getvalue(), count, encode_cursor(last[6], last[0]) if has_more else None
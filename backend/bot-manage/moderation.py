@@ -0,0 +1,101 @@
+import os
+from datetime import datetime
+
+CHUNK_SIZE = int(os.environ.get('MODERATION_CHUNK_SIZE', '5000'))
+MAX_IDS = 100000
+
+
+def compile_filter(spec):
+    """Фильтр массовой модерации → условие по bot_users u; пустой фильтр запрещён. Число сообщений — счётчик messages_in"""
+    conditions = []
+    args = []
+    if spec.get('joinedWithinMinutes'):
+        conditions.append('u.joined_at >= NOW() - make_interval(mins => %s)')
+        args.append(int(spec['joinedWithinMinutes']))
+    if spec.get('joinedAfter'):
+        conditions.append('u.joined_at >= %s')
+        args.append(datetime.fromisoformat(spec['joinedAfter']))
+    if spec.get('joinedBefore'):
+        conditions.append('u.joined_at < %s')
+        args.append(datetime.fromisoformat(spec['joinedBefore']))
+    messages = 'u.messages_in'
+    if spec.get('minMessages') is not None:
+        conditions.append(f'{messages} > %s')
+        args.append(int(spec['minMessages']))
+    if spec.get('maxMessages') is not None:
+        conditions.append(f'{messages} <= %s')
+        args.append(int(spec['maxMessages']))
+    if not conditions:
+        raise ValueError('Пустой фильтр')
+    return ' AND '.join(conditions), args
+
+
+def block_ids(conn, cur, telegram_ids, block):
+    """(найдено пользователей, изменено, чанков); matched — реально существующие строки, а не длина списка"""
+    matched = 0
+    affected = 0
+    chunks = 0
+    for start in range(0, len(telegram_ids), CHUNK_SIZE):
+        chunk = telegram_ids[start:start + CHUNK_SIZE]
+        cur.execute("""
+            WITH target AS (
+                SELECT id, is_blocked FROM bot_users WHERE telegram_id = ANY(%s)
+            ), updated AS (
+                UPDATE bot_users SET is_blocked = %s
+                WHERE id IN (SELECT id FROM target WHERE is_blocked IS DISTINCT FROM %s)
+                RETURNING id
+            )
+            SELECT (SELECT COUNT(*) FROM target), (SELECT COUNT(*) FROM updated)
+        """, (chunk, block, block))
+        found, updated = cur.fetchone()
+        matched += found
+        affected += updated
+        chunks += 1
+        conn.commit()
+    return matched, affected, chunks
+
+
+def block_filtered(conn, cur, where, args, block):
+    """Чанки по id пользователя: каждый — один UPDATE ... WHERE id IN (SELECT ... LIMIT) в своей транзакции"""
+    total = 0
+    affected = 0
+    chunks = 0
+    last_id = 0
+    while True:
+        cur.execute(f"""
+            WITH batch AS (
+                SELECT u.id FROM bot_users u
+                WHERE u.id > %s AND {where}
+                ORDER BY u.id
+                LIMIT %s
+            ), updated AS (
+                UPDATE bot_users SET is_blocked = %s
+                WHERE id IN (SELECT id FROM batch) AND is_blocked IS DISTINCT FROM %s
+                RETURNING id
+            )
+            SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM batch), (SELECT COUNT(*) FROM updated)
+        """, [last_id] + args + [CHUNK_SIZE, block, block])
+        max_id, matched, updated = cur.fetchone()
+        conn.commit()
+        total += matched
+        affected += updated
+        chunks += 1
+        if matched < CHUNK_SIZE:
+            break
+        last_id = max_id
+    return total, affected, chunks
+
+
+def count_ids(cur, telegram_ids):
+    cur.execute("SELECT COUNT(*) FROM bot_users WHERE telegram_id = ANY(%s)", (telegram_ids,))
+    return cur.fetchone()[0]
+
+
+def count_filtered(cur, where, args):
+    cur.execute(f"SELECT COUNT(*) FROM bot_users u WHERE {where}", args)
+    return cur.fetchone()[0]
+
+
+def active_broadcasts(cur):
+    cur.execute("SELECT COUNT(*) FROM bot_broadcasts WHERE status = 'sending'")
+    return cur.fetchone()[0]
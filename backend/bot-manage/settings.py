@@ -0,0 +1,43 @@
+from psycopg2.extras import execute_values
+
+SETTINGS_LOCK = 7301
+
+
+def current_version(cur):
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM bot_settings")
+    return cur.fetchone()[0]
+
+
+def etag(version):
+    return f'"settings-{version}"'
+
+
+def read_settings(cur, since=None):
+    """Снимок настроек с версией; при since — только ключи, изменённые после этой версии"""
+    if since is None:
+        cur.execute("SELECT key, value, version FROM bot_settings")
+    else:
+        cur.execute("SELECT key, value, version FROM bot_settings WHERE version > %s", (since,))
+    rows = cur.fetchall()
+    version = max([row[2] for row in rows], default=None)
+    if version is None:
+        version = current_version(cur) if since is None else since
+    return {row[0]: row[1] for row in rows}, version
+
+
+def write_settings(conn, cur, values):
+    """Один upsert на все ключи под общей версией; блокировка упорядочивает версии по коммитам, чтобы since не пропускал изменения"""
+    if not values:
+        return current_version(cur), 0
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SETTINGS_LOCK,))
+    cur.execute("SELECT nextval('bot_settings_version_seq')")
+    version = cur.fetchone()[0]
+    rows = [(str(key), str(value), version) for key, value in values.items()]
+    execute_values(cur, """
+        INSERT INTO bot_settings (key, value, version, updated_at) VALUES %s
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, version = EXCLUDED.version, updated_at = NOW()
+        WHERE bot_settings.value IS DISTINCT FROM EXCLUDED.value
+    """, rows, template='(%s, %s, %s, NOW())')
+    changed = cur.rowcount
+    conn.commit()
+    return version if changed else current_version(cur), changed
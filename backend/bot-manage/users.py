@@ -0,0 +1,101 @@
+import json
+import os
+from datetime import datetime
+from cursors import decode_cursor, encode_cursor
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+EXACT_COUNT_THRESHOLD = int(os.environ.get('USERS_EXACT_COUNT_THRESHOLD', '50000'))
+
+USER_COLUMNS = ("id, telegram_id, username, first_name, last_name, is_blocked, joined_at, last_active_at, "
+                "messages_in, messages_out, commands_count, last_message_at")
+
+SORTS = {
+    'joined': ('joined_at', datetime.fromisoformat),
+    'activity': ("COALESCE(last_message_at, TIMESTAMP '1970-01-01')", datetime.fromisoformat),
+    'messages': ('messages_in', int),
+}
+
+
+def search_filter(search):
+    if not search:
+        return '', ()
+    pattern = f'%{search}%'
+    return '(username ILIKE %s OR first_name ILIKE %s)', (pattern, pattern)
+
+
+def estimate_rows(cur, where, args):
+    """Оценка числа строк по плану запроса, без выполнения"""
+    cur.execute("EXPLAIN (FORMAT JSON) SELECT 1 FROM bot_users WHERE " + where, args)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_users(cur, where, args, exact):
+    if not exact:
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'bot_users'::regclass")
+        table_rows = cur.fetchone()[0]
+        if table_rows >= EXACT_COUNT_THRESHOLD:
+            return (estimate_rows(cur, where, args) if where else table_rows), True
+    cur.execute("SELECT COUNT(*) FROM bot_users" + (" WHERE " + where if where else ''), args)
+    return cur.fetchone()[0], False
+
+
+def user_dict(row):
+    return {
+        'telegramId': row[1],
+        'username': row[2],
+        'firstName': row[3],
+        'lastName': row[4],
+        'isBlocked': row[5],
+        'joinedAt': row[6].isoformat(),
+        'lastActiveAt': row[7].isoformat() if row[7] else None,
+        'messagesIn': row[8],
+        'messagesOut': row[9],
+        'commandsCount': row[10],
+        'lastMessageAt': row[11].isoformat() if row[11] else None
+    }
+
+
+def list_users(cur, params):
+    """Список пользователей: keyset-курсор по (ключ сортировки, id), устаревший page — через OFFSET.
+    sort: joined (по умолчанию), activity — последнее сообщение, messages — число входящих"""
+    limit = min(int(params.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    page = int(params.get('page', '1'))
+    cursor = params.get('cursor', '')
+    exact = params.get('exact') in ('1', 'true')
+    where, args = search_filter(params.get('search', ''))
+    sort_key, parse = SORTS.get(params.get('sort'), SORTS['joined'])
+
+    total, estimated = count_users(cur, where, args, exact)
+
+    conditions = [where] if where else []
+    query_args = list(args)
+    offset = 0
+    if cursor:
+        value, row_id = decode_cursor(cursor, parse)
+        conditions.append(f'({sort_key}, id) < (%s, %s)')
+        query_args += [value, row_id]
+    else:
+        offset = (page - 1) * limit
+
+    cur.execute(
+        f"SELECT {USER_COLUMNS}, {sort_key} FROM bot_users"
+        + (" WHERE " + " AND ".join(conditions) if conditions else '')
+        + f" ORDER BY {sort_key} DESC, id DESC LIMIT %s OFFSET %s",
+        query_args + [limit + 1, offset]
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        'users': [user_dict(row) for row in rows],
+        'total': total,
+        'totalEstimated': estimated,
+        'nextCursor': encode_cursor(rows[-1][-1], rows[-1][0]) if has_more and rows else None,
+        'page': page,
+        'pages': (total + limit - 1) // limit
+    }
@@ -0,0 +1,81 @@
+import math
+from datetime import datetime, timedelta
+
+REGISTERS = 4096
+ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+COHORT_WEEKS = 8
+SERIES_DAYS = 14
+
+SKETCH_SQL = """
+    SELECT COUNT(*), COALESCE(SUM(power(2, -r)), 0)
+    FROM (
+        SELECT register, MAX(rank) AS r FROM bot_activity_sketches
+        WHERE day > %s - %s AND day <= %s
+        GROUP BY register
+    ) merged
+"""
+
+
+def estimate(filled, harmonic):
+    """Оценка HyperLogLog по числу заполненных регистров и сумме 2^-rank по ним (пустые регистры дают 2^0)"""
+    zeros = REGISTERS - filled
+    raw = ALPHA * REGISTERS * REGISTERS / (float(harmonic) + zeros)
+    if raw <= 2.5 * REGISTERS and zeros:
+        return round(REGISTERS * math.log(REGISTERS / zeros))
+    return round(raw)
+
+
+def unique_active(cur, today, days):
+    """Уникальные активные пользователи за days дней по объединению дневных скетчей (MAX по регистрам)"""
+    cur.execute(SKETCH_SQL, (today, days, today))
+    return estimate(*cur.fetchone())
+
+
+def daily_series(cur, today):
+    cur.execute("""
+        SELECT day, COUNT(*), SUM(power(2, -rank)) FROM bot_activity_sketches
+        WHERE day > %s - %s AND day <= %s
+        GROUP BY day
+    """, (today, SERIES_DAYS, today))
+    by_day = {row[0]: estimate(row[1], row[2]) for row in cur.fetchall()}
+    return [{'day': (today - timedelta(days=i)).isoformat(), 'value': by_day.get(today - timedelta(days=i), 0)}
+            for i in range(SERIES_DAYS - 1, -1, -1)]
+
+
+def cohorts(cur, today):
+    """Удержание по неделям регистрации: доля когорты, активная через N недель, из bot_retention_cohorts"""
+    since = today - timedelta(days=today.weekday() + 7 * (COHORT_WEEKS - 1))
+    cur.execute("""
+        SELECT date_trunc('week', joined_at)::date, COUNT(*) FROM bot_users
+        WHERE joined_at >= %s GROUP BY 1
+    """, (since,))
+    sizes = dict(cur.fetchall())
+    cur.execute("SELECT cohort_week, week_offset, users FROM bot_retention_cohorts WHERE cohort_week >= %s", (since,))
+    active = {}
+    for week, offset, users in cur.fetchall():
+        active.setdefault(week, {})[offset] = users
+
+    result = []
+    for i in range(COHORT_WEEKS):
+        week = since + timedelta(weeks=i)
+        size = sizes.get(week, 0)
+        weeks_since = (today - week).days // 7
+        retention = [round(active.get(week, {}).get(offset, 0) * 100 / size, 1) if size else 0
+                     for offset in range(weeks_since + 1)]
+        result.append({'week': week.isoformat(), 'size': size, 'retention': retention})
+    return result
+
+
+def build_analytics(cur):
+    """DAU/WAU/MAU по HLL-скетчам bot_activity_sketches (погрешность ~1.6%) и когорты удержания"""
+    today = datetime.utcnow().date()
+    dau = unique_active(cur, today, 1)
+    mau = unique_active(cur, today, 30)
+    return {
+        'dau': dau,
+        'wau': unique_active(cur, today, 7),
+        'mau': mau,
+        'stickiness': round(dau * 100 / mau, 1) if mau else 0,
+        'dauSeries': daily_series(cur, today),
+        'cohorts': cohorts(cur, today)
+    }
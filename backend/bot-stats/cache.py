@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from db import connection
+
+TTL = float(os.environ.get('STATS_CACHE_TTL', '15'))
+STALE_TTL = float(os.environ.get('STATS_CACHE_STALE_TTL', '60'))
+USE_DB = os.environ.get('STATS_CACHE_DB', '1') == '1'
+
+_entries = {}
+_refreshing = set()
+_lock = threading.Lock()
+
+
+def current_version(cur):
+    """Версию увеличивает bot-webhook (nextval) при каждой записи — без блокировок горячей строки"""
+    cur.execute("SELECT last_value FROM bot_stats_version_seq")
+    return cur.fetchone()[0]
+
+
+def make_entry(version, body, age=0.0):
+    return {
+        'version': version,
+        'body': body,
+        'etag': '"%s-%s"' % (version, hashlib.sha1(body.encode()).hexdigest()[:16]),
+        'stored_at': time.monotonic() - age
+    }
+
+
+def load_shared(cur, key):
+    if not USE_DB:
+        return None
+    cur.execute(
+        "SELECT version, payload, EXTRACT(EPOCH FROM NOW() - computed_at) FROM bot_stats_cache WHERE key = %s",
+        (key,)
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    return make_entry(row[0], row[1], float(row[2]))
+
+
+def compute(conn, cur, key, build, version):
+    body = json.dumps(build(cur))
+    entry = make_entry(version, body)
+    if USE_DB:
+        cur.execute("""
+            INSERT INTO bot_stats_cache (key, version, payload, computed_at) VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (key) DO UPDATE SET version = EXCLUDED.version, payload = EXCLUDED.payload, computed_at = NOW()
+        """, (key, version, body))
+        conn.commit()
+    with _lock:
+        _entries[key] = entry
+    return entry
+
+
+def refresh_async(key, build):
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                compute(conn, cur, key, build, current_version(cur))
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def state(entry, version):
+    if entry is None:
+        return 'miss'
+    age = time.monotonic() - entry['stored_at']
+    if entry['version'] == version and age < TTL:
+        return 'fresh'
+    if age < STALE_TTL:
+        return 'stale'
+    return 'miss'
+
+
+def cached(conn, cur, key, build):
+    """Возвращает закэшированный ответ: свежий — сразу, устаревший — сразу с фоновым пересчётом, иначе считает"""
+    version = current_version(cur)
+    with _lock:
+        entry = _entries.get(key)
+
+    status = state(entry, version)
+    if status != 'fresh':
+        shared = load_shared(cur, key)
+        shared_status = state(shared, version)
+        if shared_status == 'fresh' or (status == 'miss' and shared_status == 'stale'):
+            entry, status = shared, shared_status
+            with _lock:
+                _entries[key] = shared
+
+    if status == 'fresh':
+        return entry, 'hit'
+    if status == 'stale':
+        refresh_async(key, build)
+        return entry, 'stale'
+    return compute(conn, cur, key, build, version), 'miss'
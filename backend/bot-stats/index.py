@@ -1,97 +1,129 @@
-import json
-import os
-import psycopg2
 from datetime import datetime, timedelta
-
-def handler(event, context):
-    """Получение статистики Telegram бота — пользователи, сообщения, команды"""
-
-    if event.get('httpMethod') == 'OPTIONS':
-        return {'statusCode': 200, 'headers': {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET, OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type', 'Access-Control-Max-Age': '86400'}, 'body': ''}
-
-    headers = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
-
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-
+from analytics import build_analytics
+from cache import cached
+from db import connection
+from tracing import traced
+
+DAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+STATS_SQL = """
+    WITH users AS (
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE joined_at >= %(yesterday)s) AS new_today,
+               COUNT(*) FILTER (WHERE joined_at >= %(two_days_ago)s AND joined_at < %(yesterday)s) AS new_prev,
+               COUNT(*) FILTER (WHERE last_active_at >= %(hour_ago)s
+                                   OR telegram_id IN (SELECT telegram_id FROM bot_activity_staging WHERE last_at >= %(hour_ago)s)) AS active,
+               COUNT(*) FILTER (WHERE is_blocked = TRUE) AS blocked,
+               COUNT(*) FILTER (WHERE unreachable_at IS NOT NULL) AS unreachable
+        FROM bot_users
+    ),
+    days AS (
+        SELECT COALESCE(SUM(messages_in + messages_out) FILTER (WHERE day = %(today)s), 0) AS messages_today,
+               COALESCE(SUM(messages_in + messages_out) FILTER (WHERE day = %(today)s - 1), 0) AS messages_yesterday,
+               COALESCE(SUM(commands) FILTER (WHERE day = %(today)s), 0) AS commands_today,
+               json_object_agg(day, messages_in + messages_out) AS weekly
+        FROM bot_daily_stats
+        WHERE day >= %(week_start)s
+    ),
+    top AS (
+        SELECT json_agg(json_build_object('name', command, 'count', uses) ORDER BY uses DESC) AS commands
+        FROM (
+            SELECT command, SUM(uses) AS uses
+            FROM bot_daily_command_stats
+            WHERE day >= %(week_start)s
+            GROUP BY command
+            ORDER BY uses DESC
+            LIMIT 5
+        ) t
+    )
+    SELECT users.total, users.new_today, users.new_prev, users.active, users.blocked, users.unreachable,
+           days.messages_today, days.messages_yesterday, days.commands_today, days.weekly, top.commands
+    FROM users, days, top
+"""
+
+
+def calc_change(current, previous):
+    if previous == 0:
+        return "+100%" if current > 0 else "0%"
+    change = ((current - previous) / previous) * 100
+    return f"+{change:.1f}%" if change >= 0 else f"{change:.1f}%"
+
+
+def build_stats(cur):
+    """Все показатели дашборда одним запросом: счётчики пользователей + дневные роллапы bot_daily_stats.
+    Активность ещё не сброшенная вебхуком из bot_activity_staging тоже учитывается в activeSessions"""
     now = datetime.utcnow()
-    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_ago = now - timedelta(days=7)
+    today = now.date()
+    week_start = today - timedelta(days=6)
     yesterday = now - timedelta(days=1)
 
-    cur.execute("SELECT COUNT(*) FROM bot_users")
-    total_users = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM bot_users WHERE joined_at >= %s", (yesterday,))
-    new_users_today = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM bot_users WHERE joined_at >= %s AND joined_at < %s", (yesterday - timedelta(days=1), yesterday))
-    new_users_prev = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM bot_messages WHERE created_at >= %s", (today,))
-    messages_today = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM bot_messages WHERE created_at >= %s AND created_at < %s", (today - timedelta(days=1), today))
-    messages_yesterday = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM bot_commands_log WHERE created_at >= %s", (today,))
-    commands_today = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM bot_users WHERE last_active_at >= %s", (now - timedelta(hours=1),))
-    active_sessions = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM bot_users WHERE is_blocked = TRUE")
-    blocked_users = cur.fetchone()[0]
-
+    cur.execute(STATS_SQL, {
+        'today': today,
+        'week_start': week_start,
+        'yesterday': yesterday,
+        'two_days_ago': yesterday - timedelta(days=1),
+        'hour_ago': now - timedelta(hours=1)
+    })
+    (total_users, new_users_today, new_users_prev, active_sessions, blocked_users, unreachable_users,
+     messages_today, messages_yesterday, commands_today, weekly, top_commands) = cur.fetchone()
+
+    weekly = weekly or {}
     weekly_activity = []
-    for i in range(6, -1, -1):
-        day_start = (now - timedelta(days=i)).replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        cur.execute("SELECT COUNT(*) FROM bot_messages WHERE created_at >= %s AND created_at < %s", (day_start, day_end))
-        count = cur.fetchone()[0]
-        day_names = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+    for i in range(7):
+        day = week_start + timedelta(days=i)
         weekly_activity.append({
-            'day': day_names[day_start.weekday()],
-            'value': count
+            'day': DAY_NAMES[day.weekday()],
+            'value': weekly.get(day.isoformat(), 0)
         })
 
-    cur.execute("""
-        SELECT command, COUNT(*) as cnt 
-        FROM bot_commands_log 
-        WHERE created_at >= %s 
-        GROUP BY command 
-        ORDER BY cnt DESC 
-        LIMIT 5
-    """, (week_ago,))
-    top_commands = [{'name': row[0], 'count': row[1]} for row in cur.fetchall()]
-
+    top_commands = top_commands or []
     if top_commands:
         max_count = top_commands[0]['count']
         for cmd in top_commands:
             cmd['percentage'] = round((cmd['count'] / max_count) * 100) if max_count > 0 else 0
 
-    def calc_change(current, previous):
-        if previous == 0:
-            return "+100%" if current > 0 else "0%"
-        change = ((current - previous) / previous) * 100
-        return f"+{change:.1f}%" if change >= 0 else f"{change:.1f}%"
+    return {
+        'totalUsers': total_users,
+        'newUsersToday': new_users_today,
+        'usersChange': calc_change(new_users_today, new_users_prev),
+        'messagesToday': messages_today,
+        'messagesChange': calc_change(messages_today, messages_yesterday),
+        'commandsToday': commands_today,
+        'activeSessions': active_sessions,
+        'blockedUsers': blocked_users,
+        'unreachableUsers': unreachable_users,
+        'weeklyActivity': weekly_activity,
+        'topCommands': top_commands
+    }
+
+
+@traced('bot-stats')
+def handler(event, context):
+    """Получение статистики Telegram бота — пользователи, сообщения, команды; view=analytics — DAU/WAU/MAU и когорты"""
+
+    if event.get('httpMethod') == 'OPTIONS':
+        return {'statusCode': 200, 'headers': {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET, OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match', 'Access-Control-Max-Age': '86400'}, 'body': ''}
+
+    headers = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
 
-    cur.close()
-    conn.close()
+    view = (event.get('queryStringParameters') or {}).get('view')
+    key, build = ('analytics', build_analytics) if view == 'analytics' else ('dashboard', build_stats)
+
+    with connection() as conn, conn.cursor() as cur:
+        entry, cache_status = cached(conn, cur, key, build)
+
+    headers.update({
+        'ETag': entry['etag'],
+        'Cache-Control': 'no-cache',
+        'X-Cache': cache_status,
+        'Access-Control-Expose-Headers': 'ETag, X-Cache'
+    })
+    req_headers = event.get('headers') or {}
+    if req_headers.get('If-None-Match', req_headers.get('if-none-match')) == entry['etag']:
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
 
     return {
         'statusCode': 200,
         'headers': headers,
-        'body': json.dumps({
-            'totalUsers': total_users,
-            'newUsersToday': new_users_today,
-            'usersChange': calc_change(new_users_today, new_users_prev),
-            'messagesToday': messages_today,
-            'messagesChange': calc_change(messages_today, messages_yesterday),
-            'commandsToday': commands_today,
-            'activeSessions': active_sessions,
-            'blockedUsers': blocked_users,
-            'weeklyActivity': weekly_activity,
-            'topCommands': top_commands
-        })
+        'body': entry['body']
     }
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from datetime import datetime
+from psycopg2.extras import execute_values
+from sketches import record_sketches
+
+WRITE_MODE = os.environ.get('ACTIVITY_WRITE_MODE', 'staging')
+FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '5'))
+MEMORY_MAX_USERS = int(os.environ.get('ACTIVITY_MEMORY_MAX_USERS', '5000'))
+FLUSH_LOCK = 7302
+
+AGGREGATE_SQL = """
+    SELECT r.telegram_id,
+           MAX(COALESCE(r.ts, NOW()::timestamp)),
+           COUNT(*) FILTER (WHERE r.direction = 'in'),
+           COUNT(*) FILTER (WHERE r.direction IS NOT NULL AND r.direction <> 'in'),
+           COUNT(*) FILTER (WHERE r.command IS NOT NULL),
+           MAX(COALESCE(r.ts, NOW()::timestamp)) FILTER (WHERE r.direction IS NOT NULL)
+    FROM (VALUES %s) AS r(telegram_id, ts, direction, command)
+    GROUP BY r.telegram_id
+"""
+ROW_TEMPLATE = '(%s::bigint, %s::timestamp, %s::varchar, %s::varchar)'
+
+APPLY_SQL = """
+    {prefix}
+    UPDATE bot_users u SET
+        last_active_at = GREATEST(u.last_active_at, v.last_at),
+        messages_in = u.messages_in + v.messages_in,
+        messages_out = u.messages_out + v.messages_out,
+        commands_count = u.commands_count + v.commands,
+        last_message_at = GREATEST(u.last_message_at, v.last_message_at),
+        unreachable_at = CASE WHEN v.messages_in > 0 OR v.commands > 0 THEN NULL ELSE u.unreachable_at END,
+        unreachable_reason = CASE WHEN v.messages_in > 0 OR v.commands > 0 THEN NULL ELSE u.unreachable_reason END
+    FROM {source} AS v(telegram_id, last_at, messages_in, messages_out, commands, last_message_at)
+    WHERE u.telegram_id = v.telegram_id
+"""
+
+_buffer = {}
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def merge(current, item):
+    if current is None:
+        return list(item)
+    return [
+        max(current[0], item[0]),
+        current[1] + item[1],
+        current[2] + item[2],
+        current[3] + item[3],
+        max(filter(None, (current[4], item[4])), default=None)
+    ]
+
+
+def buffer_rows(rows):
+    """Агрегирует активность в памяти тёплого экземпляра; при падении экземпляра несброшенная часть теряется"""
+    now = datetime.utcnow()
+    with _buffer_lock:
+        for tid, ts, direction, command in rows:
+            ts = ts or now
+            item = (ts, int(direction == 'in'), int(direction is not None and direction != 'in'),
+                    int(command is not None), ts if direction is not None else None)
+            _buffer[tid] = merge(_buffer.get(tid), item)
+
+
+def record_activity(cur, rows):
+    """rows — (telegram_id, ts | None, direction | None, command | None). Скетчи DAU/WAU/MAU и когорт пишутся сразу.
+    direct — сразу UPDATE bot_users; staging — в UNLOGGED bot_activity_staging; memory — в буфер процесса"""
+    if not rows:
+        return 0
+    record_sketches(cur, rows)
+    if WRITE_MODE == 'memory':
+        buffer_rows(rows)
+        return len({row[0] for row in rows})
+    if WRITE_MODE == 'staging':
+        execute_values(cur, "INSERT INTO bot_activity_staging " + AGGREGATE_SQL, rows,
+                       template=ROW_TEMPLATE, page_size=len(rows))
+        return cur.rowcount
+    execute_values(cur, APPLY_SQL.format(prefix='', source=f'({AGGREGATE_SQL})'), rows,
+                   template=ROW_TEMPLATE, page_size=len(rows))
+    return cur.rowcount
+
+
+def flush_due():
+    if WRITE_MODE == 'direct':
+        return False
+    if WRITE_MODE == 'memory' and len(_buffer) >= MEMORY_MAX_USERS:
+        return True
+    return time.monotonic() - _last_flush >= FLUSH_INTERVAL
+
+
+def flush_activity(conn, cur):
+    """Переносит накопленную активность в bot_users одним UPDATE ... FROM; возвращает число обновлённых пользователей"""
+    global _last_flush
+    _last_flush = time.monotonic()
+    if WRITE_MODE == 'memory':
+        with _buffer_lock:
+            items = [(tid,) + tuple(values) for tid, values in _buffer.items()]
+            _buffer.clear()
+        if not items:
+            return 0
+        try:
+            execute_values(cur, APPLY_SQL.format(prefix='', source='(VALUES %s)'), items,
+                           template='(%s::bigint, %s::timestamp, %s::int, %s::int, %s::int, %s::timestamp)',
+                           page_size=len(items))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            for item in items:
+                with _buffer_lock:
+                    _buffer[item[0]] = merge(_buffer.get(item[0]), item[1:])
+            raise
+        return cur.rowcount
+
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (FLUSH_LOCK,))
+    if not cur.fetchone()[0]:
+        conn.rollback()
+        return 0
+    cur.execute(APPLY_SQL.format(prefix="""
+        WITH moved AS (DELETE FROM bot_activity_staging RETURNING *),
+        staged AS (
+            SELECT telegram_id, MAX(last_at), SUM(messages_in)::int, SUM(messages_out)::int,
+                   SUM(commands)::int, MAX(last_message_at)
+            FROM moved
+            GROUP BY telegram_id
+        )
+    """, source='staged'))
+    updated = cur.rowcount
+    conn.commit()
+    return updated
+
+
+def maybe_flush(conn, cur):
+    if flush_due():
+        return flush_activity(conn, cur)
+    return 0
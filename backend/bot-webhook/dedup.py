@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from psycopg2.extras import execute_values
+
+CACHE_SIZE = int(os.environ.get('WEBHOOK_DEDUP_CACHE_SIZE', '20000'))
+RETENTION_DAYS = int(os.environ.get('WEBHOOK_DEDUP_RETENTION_DAYS', '7'))
+PURGE_CHUNK = 5000
+PURGE_INTERVAL = 3600
+PURGE_BACKLOG_INTERVAL = 60
+PURGE_MAX_CHUNKS = int(os.environ.get('WEBHOOK_DEDUP_PURGE_MAX_CHUNKS', '10'))
+MAX_KEY_LENGTH = 128
+
+_recent = OrderedDict()
+_lock = threading.Lock()
+_local = threading.local()
+_next_purge = 0.0
+
+
+def event_key(ev):
+    """Ключ идемпотентности: event_id клиента, update_id Telegram или message_id в пределах чата"""
+    if ev.get('event_id') not in (None, ''):
+        return str(ev['event_id'])[:MAX_KEY_LENGTH]
+    if ev.get('update_id') is not None:
+        return f"tg:{ev['update_id']}"
+    tid = ev.get('telegram_id') or ev.get('user_id') or ev.get('from_id')
+    if ev.get('message_id') is not None and tid:
+        return f"msg:{tid}:{ev['message_id']}"
+    return None
+
+
+def pending():
+    if not hasattr(_local, 'pending'):
+        _local.pending = set()
+    return _local.pending
+
+
+def reset_pending():
+    _local.pending = set()
+
+
+def seen(key):
+    with _lock:
+        if key in _recent:
+            _recent.move_to_end(key)
+            return True
+    return False
+
+
+def claim(cur, keys):
+    """Возвращает ключи, впервые записанные в bot_webhook_events в текущей транзакции.
+    Недавние ключи из кэша процесса отсекаются без обращения к БД"""
+    fresh = [key for key in dict.fromkeys(keys) if key and not seen(key)]
+    if not fresh:
+        return set()
+    claimed = execute_values(
+        cur,
+        "INSERT INTO bot_webhook_events (event_id) VALUES %s ON CONFLICT (event_id) DO NOTHING RETURNING event_id",
+        [(key,) for key in fresh], page_size=len(fresh), fetch=True
+    )
+    claimed = {row[0] for row in claimed}
+    pending().update(claimed)
+    return claimed
+
+
+def remember_committed():
+    """Переносит ключи закоммиченной транзакции в кэш процесса"""
+    keys = pending()
+    if not keys:
+        return
+    with _lock:
+        for key in keys:
+            _recent[key] = True
+            _recent.move_to_end(key)
+        while len(_recent) > CACHE_SIZE:
+            _recent.popitem(last=False)
+    keys.clear()
+
+
+def split_new(cur, items, key_of):
+    """Делит элементы на новые и дубли; элементы без ключа всегда новые, повтор ключа внутри пачки — дубль"""
+    keys = [key_of(item) for item in items]
+    claimed = claim(cur, [key for key in keys if key])
+    fresh = []
+    duplicates = 0
+    used = set()
+    for item, key in zip(items, keys):
+        if key is None:
+            fresh.append(item)
+        elif key in claimed and key not in used:
+            used.add(key)
+            fresh.append(item)
+        else:
+            duplicates += 1
+    return fresh, duplicates
+
+
+def purge_due():
+    return time.monotonic() >= _next_purge
+
+
+def purge_old(conn, cur, max_chunks=None):
+    """Удаляет ключи старше WEBHOOK_DEDUP_RETENTION_DAYS порциями по PURGE_CHUNK, каждая порция — отдельная транзакция.
+    Если max_chunks не хватило, следующая чистка — через PURGE_BACKLOG_INTERVAL, а не через час"""
+    global _next_purge
+    _next_purge = time.monotonic() + PURGE_INTERVAL
+    deleted = 0
+    chunks = 0
+    backlog = False
+    while max_chunks is None or chunks < max_chunks:
+        cur.execute("""
+            DELETE FROM bot_webhook_events WHERE event_id IN (
+                SELECT event_id FROM bot_webhook_events
+                WHERE received_at < NOW() - make_interval(days => %s)
+                LIMIT %s
+            )
+        """, (RETENTION_DAYS, PURGE_CHUNK))
+        conn.commit()
+        deleted += cur.rowcount
+        chunks += 1
+        backlog = cur.rowcount == PURGE_CHUNK
+        if not backlog:
+            break
+    _next_purge = time.monotonic() + (PURGE_BACKLOG_INTERVAL if backlog else PURGE_INTERVAL)
+    return deleted
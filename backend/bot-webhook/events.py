@@ -0,0 +1,125 @@
+import os
+import time
+from datetime import datetime
+from psycopg2.extras import execute_values
+from activity import record_activity
+from dedup import event_key, split_new
+from rollup import bump_daily, notify_live
+
+BATCH_MAX_EVENTS = int(os.environ.get('WEBHOOK_BATCH_MAX', '1000'))
+EVENT_TYPES = ('user', 'message', 'command')
+STRING_FIELDS = {'username': 255, 'first_name': 255, 'last_name': 255, 'command': 255, 'direction': 10, 'text': None}
+BIGINT_MAX = 2 ** 63 - 1
+
+
+def parse_ts(value):
+    """Время события: unix-время от Telegram (date) или ISO-строка; None — «сейчас» на стороне БД"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def event_error(ev):
+    """Почему событие нельзя записать в БД, или None — те же ограничения, что у колонок bot_users, bot_messages и bot_commands_log"""
+    if not isinstance(ev, dict):
+        return 'событие должно быть объектом'
+    if ev.get('type') not in EVENT_TYPES:
+        return f"неизвестный type: {ev.get('type')}"
+    tid = ev.get('telegram_id')
+    if isinstance(tid, bool) or not isinstance(tid, (int, str)):
+        return 'telegram_id должен быть целым числом'
+    try:
+        tid = int(tid)
+    except ValueError:
+        return 'telegram_id должен быть целым числом'
+    if not tid or abs(tid) > BIGINT_MAX:
+        return 'telegram_id вне диапазона BIGINT'
+    for field, limit in STRING_FIELDS.items():
+        value = ev.get(field)
+        if value is None:
+            continue
+        if not isinstance(value, str) or '\x00' in value:
+            return f'{field} должен быть строкой без NUL'
+        if limit and len(value) > limit:
+            return f'{field} длиннее {limit} символов'
+    try:
+        parse_ts(ev.get('ts', ev.get('date')))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return 'ts/date: ожидается unix-время или ISO-строка'
+    return None
+
+
+def apply_batch(cur, events):
+    """Применяет пачку событий user/message/command мульти-строчными INSERT и одним UPDATE счётчиков и last_active_at"""
+    started = time.perf_counter()
+    users = {}
+    messages = []
+    commands = []
+    activity = []
+    valid = [ev for ev in events if event_error(ev) is None]
+    skipped = len(events) - len(valid)
+    fresh, duplicates = split_new(cur, valid, event_key)
+
+    for ev in fresh:
+        ev_type = ev.get('type')
+        tid = int(ev['telegram_id'])
+        ts = parse_ts(ev.get('ts', ev.get('date')))
+        if ev_type == 'user':
+            users[tid] = (tid, ev.get('username', ''), ev.get('first_name', ''), ev.get('last_name', ''), ts)
+            activity.append((tid, ts, None, None))
+        elif ev_type == 'message':
+            messages.append((tid, ev.get('direction', 'in'), ev.get('text', ''), ts))
+            activity.append((tid, ts, messages[-1][1], None))
+        else:
+            commands.append((tid, ev.get('command', ''), ts))
+            activity.append((tid, ts, None, commands[-1][1]))
+
+    new_users = 0
+    if users:
+        created = execute_values(cur, """
+            INSERT INTO bot_users (telegram_id, username, first_name, last_name, last_active_at)
+            VALUES %s
+            ON CONFLICT (telegram_id) DO UPDATE SET
+                username = EXCLUDED.username,
+                first_name = EXCLUDED.first_name,
+                last_name = EXCLUDED.last_name,
+                unreachable_at = NULL,
+                unreachable_reason = NULL
+            RETURNING (xmax = 0)
+        """, list(users.values()), template='(%s, %s, %s, %s, COALESCE(%s, NOW()))', page_size=len(users), fetch=True)
+        new_users = sum(1 for row in created if row[0])
+
+    if messages:
+        execute_values(
+            cur,
+            "INSERT INTO bot_messages (telegram_id, direction, text, created_at) VALUES %s",
+            messages, template='(%s, %s, %s, COALESCE(%s, NOW()))', page_size=len(messages)
+        )
+
+    if commands:
+        execute_values(
+            cur,
+            "INSERT INTO bot_commands_log (telegram_id, command, created_at) VALUES %s",
+            commands, template='(%s, %s, COALESCE(%s, NOW()))', page_size=len(commands)
+        )
+
+    bump_daily(cur, [(m[3], m[1], None) for m in messages] + [(c[2], None, c[1]) for c in commands])
+
+    activity_updates = record_activity(cur, activity)
+
+    if fresh:
+        messages_in = sum(1 for m in messages if m[1] == 'in')
+        notify_live(cur, new_users, messages_in, len(messages) - messages_in, len(commands))
+
+    return {
+        'users': len(users),
+        'messages': len(messages),
+        'commands': len(commands),
+        'activityUpdates': activity_updates,
+        'inserted': len(fresh),
+        'deduplicated': duplicates,
+        'skipped': skipped,
+        'ms': round((time.perf_counter() - started) * 1000, 1)
+    }
@@ -1,8 +1,16 @@
 import json
 import os
-import psycopg2
 from datetime import datetime
-
+from activity import maybe_flush, record_activity
+from db import connection
+from dedup import PURGE_MAX_CHUNKS, event_key, purge_due, purge_old, remember_committed, reset_pending, split_new
+from events import BATCH_MAX_EVENTS, apply_batch, event_error
+from ingest import IMPORTERS, bulk_import, is_ndjson, iter_ndjson, read_json_body
+from ingest_queue import enqueue_events, queue_enabled, queue_stats
+from rollup import bump_daily, invalidate_stats, notify_live
+from tracing import tag, traced
+
+@traced('bot-webhook')
 def handler(event, context):
     """Webhook для приёма событий от Telegram бота на VDS — пользователи, сообщения, команды, импорт JSON"""
 
@@ -21,113 +29,128 @@ def handler(event, context):
     if not expected or secret != expected:
         return {'statusCode': 403, 'headers': headers, 'body': json.dumps({'error': 'Forbidden'})}
 
-    body = json.loads(event.get('body', '{}'))
+    if is_ndjson(event):
+        event_type = (event.get('queryStringParameters') or {}).get('type', '')
+        tag('type', event_type)
+        if event_type not in IMPORTERS:
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'NDJSON поддерживается только для import_users и import_messages'})}
+        with connection() as conn, conn.cursor() as cur:
+            reset_pending()
+            result = bulk_import(conn, cur, event_type, iter_ndjson(event))
+            notify_live(cur, imported=True)
+            conn.commit()
+            maybe_flush(conn, cur)
+            invalidate_stats(cur)
+        return {'statusCode': 200, 'headers': headers, 'body': json.dumps(result)}
+
+    body = read_json_body(event)
     event_type = body.get('type', '')
+    tag('type', event_type)
+
+    if event_type == 'ping':
+        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'status': 'ok', 'time': datetime.utcnow().isoformat()})}
+
+    if event_type == 'queue_stats':
+        with connection() as conn, conn.cursor() as cur:
+            stats = queue_stats(cur)
+        return {'statusCode': 200, 'headers': headers, 'body': json.dumps(stats)}
+
+    if event_type not in ('user', 'message', 'command', 'batch') and event_type not in IMPORTERS:
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': f'Unknown type: {event_type}'})}
+
+    if event_type == 'batch' and len(body.get('events', [])) > BATCH_MAX_EVENTS:
+        return {'statusCode': 413, 'headers': headers, 'body': json.dumps({'error': f'Не больше {BATCH_MAX_EVENTS} событий в пачке'})}
+
+    if queue_enabled(event_type):
+        events = body.get('events', []) if event_type == 'batch' else [body]
+        if not isinstance(events, list):
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'events должен быть массивом'})}
+        errors = [event_error(ev) for ev in events]
+        invalid = [{'index': i, 'error': error} for i, error in enumerate(errors) if error]
+        with connection() as conn, conn.cursor() as cur:
+            queued = enqueue_events(cur, [ev for ev, error in zip(events, errors) if not error])
+            conn.commit()
+        return {'statusCode': 202, 'headers': headers, 'body': json.dumps({'ok': True, 'queued': queued, 'skipped': len(invalid), 'invalid': invalid[:20]})}
+
+    with connection() as conn, conn.cursor() as cur:
+        reset_pending()
+        if purge_due():
+            purge_old(conn, cur, max_chunks=PURGE_MAX_CHUNKS)
+
+        if event_type in ('message', 'command'):
+            _, duplicates = split_new(cur, [body], event_key)
+            if duplicates:
+                return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'ok': True, 'inserted': 0, 'deduplicated': 1})}
+
+        if event_type == 'user':
+            telegram_id = body.get('telegram_id')
+            username = body.get('username', '')
+            first_name = body.get('first_name', '')
+            last_name = body.get('last_name', '')
 
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-
-    if event_type == 'user':
-        telegram_id = body.get('telegram_id')
-        username = body.get('username', '')
-        first_name = body.get('first_name', '')
-        last_name = body.get('last_name', '')
-
-        cur.execute("""
-            INSERT INTO bot_users (telegram_id, username, first_name, last_name, last_active_at)
-            VALUES (%s, %s, %s, %s, NOW())
-            ON CONFLICT (telegram_id) DO UPDATE SET
-                username = EXCLUDED.username,
-                first_name = EXCLUDED.first_name,
-                last_name = EXCLUDED.last_name,
-                last_active_at = NOW()
-        """, (telegram_id, username, first_name, last_name))
-        conn.commit()
-
-    elif event_type == 'message':
-        telegram_id = body.get('telegram_id')
-        direction = body.get('direction', 'in')
-        text = body.get('text', '')
-
-        cur.execute(
-            "INSERT INTO bot_messages (telegram_id, direction, text) VALUES (%s, %s, %s)",
-            (telegram_id, direction, text)
-        )
-        cur.execute(
-            "UPDATE bot_users SET last_active_at = NOW() WHERE telegram_id = %s",
-            (telegram_id,)
-        )
-        conn.commit()
-
-    elif event_type == 'command':
-        telegram_id = body.get('telegram_id')
-        command = body.get('command', '')
-
-        cur.execute(
-            "INSERT INTO bot_commands_log (telegram_id, command) VALUES (%s, %s)",
-            (telegram_id, command)
-        )
-        cur.execute(
-            "UPDATE bot_users SET last_active_at = NOW() WHERE telegram_id = %s",
-            (telegram_id,)
-        )
-        conn.commit()
-
-    elif event_type == 'import_users':
-        users = body.get('users', [])
-        imported = 0
-        for u in users:
-            tid = u.get('telegram_id') or u.get('id') or u.get('user_id')
-            if not tid:
-                continue
             cur.execute("""
-                INSERT INTO bot_users (telegram_id, username, first_name, last_name, is_blocked, joined_at, last_active_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                INSERT INTO bot_users (telegram_id, username, first_name, last_name, last_active_at)
+                VALUES (%s, %s, %s, %s, NOW())
                 ON CONFLICT (telegram_id) DO UPDATE SET
-                    username = COALESCE(EXCLUDED.username, bot_users.username),
-                    first_name = COALESCE(EXCLUDED.first_name, bot_users.first_name),
-                    last_name = COALESCE(EXCLUDED.last_name, bot_users.last_name)
-            """, (
-                tid,
-                u.get('username', ''),
-                u.get('first_name', ''),
-                u.get('last_name', ''),
-                u.get('is_blocked', False),
-                u.get('joined_at', datetime.utcnow().isoformat())
-            ))
-            imported += 1
-        conn.commit()
-        cur.close()
-        conn.close()
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'imported': imported})}
-
-    elif event_type == 'import_messages':
-        messages = body.get('messages', [])
-        imported = 0
-        for m in messages:
-            tid = m.get('telegram_id') or m.get('user_id') or m.get('from_id')
-            if not tid:
-                continue
+                    username = EXCLUDED.username,
+                    first_name = EXCLUDED.first_name,
+                    last_name = EXCLUDED.last_name,
+                    last_active_at = NOW(),
+                    unreachable_at = NULL,
+                    unreachable_reason = NULL
+                RETURNING (xmax = 0)
+            """, (telegram_id, username, first_name, last_name))
+            notify_live(cur, users=int(cur.fetchone()[0]))
+            conn.commit()
+
+        elif event_type == 'message':
+            telegram_id = body.get('telegram_id')
+            direction = body.get('direction', 'in')
+            text = body.get('text', '')
+
             cur.execute(
-                "INSERT INTO bot_messages (telegram_id, direction, text, created_at) VALUES (%s, %s, %s, %s)",
-                (tid, m.get('direction', 'in'), m.get('text', ''), m.get('created_at', datetime.utcnow().isoformat()))
+                "INSERT INTO bot_messages (telegram_id, direction, text) VALUES (%s, %s, %s)",
+                (telegram_id, direction, text)
             )
-            imported += 1
-        conn.commit()
-        cur.close()
-        conn.close()
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'imported': imported})}
-
-    elif event_type == 'ping':
-        cur.close()
-        conn.close()
-        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'status': 'ok', 'time': datetime.utcnow().isoformat()})}
-
-    else:
-        cur.close()
-        conn.close()
-        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': f'Unknown type: {event_type}'})}
+            bump_daily(cur, [(None, direction, None)])
+            record_activity(cur, [(telegram_id, None, direction, None)])
+            if direction == 'in':
+                notify_live(cur, messages_in=1)
+            else:
+                notify_live(cur, messages_out=1)
+            conn.commit()
+
+        elif event_type == 'command':
+            telegram_id = body.get('telegram_id')
+            command = body.get('command', '')
 
-    cur.close()
-    conn.close()
-    return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'ok': True})}
+            cur.execute(
+                "INSERT INTO bot_commands_log (telegram_id, command) VALUES (%s, %s)",
+                (telegram_id, command)
+            )
+            bump_daily(cur, [(None, None, command)])
+            record_activity(cur, [(telegram_id, None, None, command)])
+            notify_live(cur, commands=1)
+            conn.commit()
+
+        elif event_type == 'batch':
+            result = apply_batch(cur, body.get('events', []))
+            conn.commit()
+            remember_committed()
+            maybe_flush(conn, cur)
+            invalidate_stats(cur)
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps(result)}
+
+        elif event_type in IMPORTERS:
+            records = body.get('users' if event_type == 'import_users' else 'messages', [])
+            result = bulk_import(conn, cur, event_type, records)
+            notify_live(cur, imported=True)
+            conn.commit()
+            maybe_flush(conn, cur)
+            invalidate_stats(cur)
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps(result)}
+
+        remember_committed()
+        maybe_flush(conn, cur)
+        invalidate_stats(cur)
+        return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'ok': True, 'inserted': 1, 'deduplicated': 0})}
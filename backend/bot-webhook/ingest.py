@@ -0,0 +1,156 @@
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from datetime import datetime
+from psycopg2.extras import execute_values
+from activity import record_activity
+from dedup import event_key, remember_committed, split_new
+from rollup import bump_daily
+
+BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '5000'))
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-lines')
+
+
+def header(req_headers, name):
+    for key, value in req_headers.items():
+        if key.lower() == name:
+            return value or ''
+    return ''
+
+
+def content_type(event):
+    return header(event.get('headers') or {}, 'content-type').split(';')[0].strip().lower()
+
+
+def is_ndjson(event):
+    return content_type(event) in NDJSON_TYPES
+
+
+def open_body(event):
+    """Возвращает тело запроса как текстовый поток, распаковывая base64 и gzip"""
+    raw = event.get('body') or ''
+    data = base64.b64decode(raw) if event.get('isBase64Encoded') else raw.encode()
+    stream = io.BytesIO(data)
+    if header(event.get('headers') or {}, 'content-encoding').lower() == 'gzip' or data[:2] == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream)
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def read_json_body(event):
+    if not event.get('isBase64Encoded') and not header(event.get('headers') or {}, 'content-encoding'):
+        return json.loads(event.get('body') or '{}')
+    return json.load(open_body(event))
+
+
+def iter_ndjson(event):
+    """Разбирает NDJSON построчно, не собирая всё тело в один json.loads"""
+    for line in open_body(event):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def batched(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def user_row(u, now):
+    tid = u.get('telegram_id') or u.get('id') or u.get('user_id')
+    if not tid:
+        return None
+    return (
+        tid,
+        u.get('username', ''),
+        u.get('first_name', ''),
+        u.get('last_name', ''),
+        u.get('is_blocked', False),
+        u.get('joined_at', now)
+    )
+
+
+def message_row(m, now):
+    tid = m.get('telegram_id') or m.get('user_id') or m.get('from_id')
+    if not tid:
+        return None
+    return (tid, m.get('direction', 'in'), m.get('text') or '', m.get('created_at', now), event_key(m))
+
+
+def write_users(cur, rows):
+    unique = {}
+    for row in rows:
+        unique[row[0]] = row
+    execute_values(cur, """
+        INSERT INTO bot_users (telegram_id, username, first_name, last_name, is_blocked, joined_at, last_active_at)
+        VALUES %s
+        ON CONFLICT (telegram_id) DO UPDATE SET
+            username = COALESCE(EXCLUDED.username, bot_users.username),
+            first_name = COALESCE(EXCLUDED.first_name, bot_users.first_name),
+            last_name = COALESCE(EXCLUDED.last_name, bot_users.last_name)
+    """, list(unique.values()), template='(%s, %s, %s, %s, %s, %s, NOW())', page_size=len(unique))
+    return len(unique), 0
+
+
+def write_messages(cur, rows):
+    """Сообщения с event_id/update_id/message_id, уже загруженные ранее, отбрасываются до COPY"""
+    rows, duplicates = split_new(cur, rows, lambda row: row[4])
+    if not rows:
+        return 0, duplicates
+    buf = io.StringIO()
+    csv.writer(buf, quoting=csv.QUOTE_ALL).writerows(row[:4] for row in rows)
+    buf.seek(0)
+    cur.copy_expert("COPY bot_messages (telegram_id, direction, text, created_at) FROM STDIN WITH (FORMAT csv)", buf)
+    bump_daily(cur, [(row[3], row[1], None) for row in rows])
+    record_activity(cur, [(row[0], row[3], row[1], None) for row in rows])
+    return len(rows), duplicates
+
+
+IMPORTERS = {
+    'import_users': (user_row, write_users),
+    'import_messages': (message_row, write_messages),
+}
+
+
+def bulk_import(conn, cur, event_type, records, batch_size=None):
+    """Пишет записи батчами (execute_values / COPY) с коммитом после каждого батча"""
+    to_row, write = IMPORTERS[event_type]
+    now = datetime.utcnow().isoformat()
+    started = time.perf_counter()
+    imported = 0
+    deduplicated = 0
+    batches = []
+
+    def rows():
+        for record in records:
+            row = to_row(record, now)
+            if row is not None:
+                yield row
+
+    for number, batch in enumerate(batched(rows(), batch_size or BATCH_SIZE), 1):
+        batch_started = time.perf_counter()
+        written, duplicates = write(cur, batch)
+        conn.commit()
+        remember_committed()
+        imported += written
+        deduplicated += duplicates
+        batches.append({'batch': number, 'rows': written, 'deduplicated': duplicates,
+                        'ms': round((time.perf_counter() - batch_started) * 1000, 1)})
+
+    elapsed = time.perf_counter() - started
+    return {
+        'imported': imported,
+        'deduplicated': deduplicated,
+        'batches': batches,
+        'ms': round(elapsed * 1000, 1),
+        'rowsPerSec': round(imported / elapsed) if elapsed and imported else 0
+    }
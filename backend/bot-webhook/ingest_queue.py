@@ -0,0 +1,103 @@
+import json
+import os
+from psycopg2.extras import execute_values
+from dedup import pending, remember_committed
+from events import apply_batch, event_error
+
+WEBHOOK_MODE = os.environ.get('WEBHOOK_MODE', 'sync')
+CHANNEL = 'bot_ingest'
+DRAIN_BATCH = int(os.environ.get('WEBHOOK_DRAIN_BATCH', '5000'))
+QUEUED_TYPES = ('user', 'message', 'command', 'batch')
+
+
+def queue_enabled(event_type):
+    return WEBHOOK_MODE == 'queue' and event_type in QUEUED_TYPES
+
+
+def enqueue_events(cur, events):
+    """Сырые события в bot_ingest_queue и NOTIFY — уведомление уйдёт воркеру только после COMMIT"""
+    if not events:
+        return 0
+    execute_values(cur, "INSERT INTO bot_ingest_queue (payload) VALUES %s",
+                   [(json.dumps(ev, ensure_ascii=False),) for ev in events], page_size=len(events))
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, str(len(events))))
+    return len(events)
+
+
+def apply_isolated(cur, items, dead):
+    """apply_batch под SAVEPOINT. Упавшая пачка делится пополам, пока ошибка не сузится до одного события —
+    оно уходит в dead, остальные применяются. items — [(payload, received_at)]"""
+    keys = set(pending())
+    cur.execute("SAVEPOINT ingest_apply")
+    try:
+        result = apply_batch(cur, [payload for payload, _ in items])
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT ingest_apply")
+        cur.execute("RELEASE SAVEPOINT ingest_apply")
+        pending().intersection_update(keys)
+        if len(items) == 1:
+            dead.append(items[0] + (f'{type(e).__name__}: {e}',))
+            return {}
+        middle = len(items) // 2
+        first = apply_isolated(cur, items[:middle], dead)
+        second = apply_isolated(cur, items[middle:], dead)
+        return {key: first.get(key, 0) + second.get(key, 0) for key in first.keys() | second.keys()}
+    cur.execute("RELEASE SAVEPOINT ingest_apply")
+    return result
+
+
+def drain_batch(conn, cur, limit=None):
+    """Забирает до limit событий (SKIP LOCKED — воркеры не мешают друг другу) и применяет их через apply_batch
+    в той же транзакции. События, которые нельзя применить, переносятся в bot_ingest_dead_letters и не держат
+    очередь. None — очередь пуста"""
+    cur.execute("""
+        WITH taken AS (
+            DELETE FROM bot_ingest_queue WHERE id IN (
+                SELECT id FROM bot_ingest_queue ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, payload, received_at
+        )
+        SELECT payload, received_at, EXTRACT(EPOCH FROM clock_timestamp()::timestamp - received_at)
+        FROM taken ORDER BY id
+    """, (limit or DRAIN_BATCH,))
+    rows = cur.fetchall()
+    if not rows:
+        conn.commit()
+        return None
+
+    items = []
+    dead = []
+    for payload, received_at, _ in rows:
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        if isinstance(payload, dict) and payload.get('ts') is None and payload.get('date') is None:
+            payload = dict(payload, ts=received_at.isoformat())
+        error = event_error(payload)
+        if error:
+            dead.append((payload, received_at, error))
+        else:
+            items.append((payload, received_at))
+
+    result = apply_isolated(cur, items, dead) if items else {}
+    if dead:
+        execute_values(cur, "INSERT INTO bot_ingest_dead_letters (payload, received_at, error) VALUES %s",
+                       [(json.dumps(payload, ensure_ascii=False), received_at, error) for payload, received_at, error in dead],
+                       page_size=len(dead))
+    conn.commit()
+    remember_committed()
+    result['drained'] = len(rows)
+    result['deadLettered'] = len(dead)
+    result['lagMs'] = round(max(row[2] for row in rows) * 1000, 1)
+    return result
+
+
+def queue_stats(cur):
+    """Глубина очереди, возраст самого старого события и число событий в bot_ingest_dead_letters"""
+    cur.execute("""
+        SELECT COUNT(*), EXTRACT(EPOCH FROM NOW() - MIN(received_at)),
+               (SELECT COUNT(*) FROM bot_ingest_dead_letters)
+        FROM bot_ingest_queue
+    """)
+    depth, lag, dead = cur.fetchone()
+    return {'mode': WEBHOOK_MODE, 'depth': depth, 'lagSeconds': round(float(lag), 1) if lag is not None else 0,
+            'deadLetters': dead}
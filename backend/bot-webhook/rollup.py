@@ -0,0 +1,48 @@
+import json
+from psycopg2.extras import execute_values
+
+
+def bump_daily(cur, rows):
+    """rows — (created_at | None, direction | None, command | None); None в created_at означает «сейчас»"""
+    if not rows:
+        return
+    execute_values(cur, """
+        INSERT INTO bot_daily_stats (day, messages_in, messages_out, commands)
+        SELECT COALESCE(v.ts::date, CURRENT_DATE),
+               COUNT(*) FILTER (WHERE v.direction = 'in'),
+               COUNT(*) FILTER (WHERE v.direction IS NOT NULL AND v.direction <> 'in'),
+               COUNT(*) FILTER (WHERE v.command IS NOT NULL)
+        FROM (VALUES %s) AS v(ts, direction, command)
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (day) DO UPDATE SET
+            messages_in = bot_daily_stats.messages_in + EXCLUDED.messages_in,
+            messages_out = bot_daily_stats.messages_out + EXCLUDED.messages_out,
+            commands = bot_daily_stats.commands + EXCLUDED.commands
+    """, rows, template='(%s::timestamp, %s::varchar, %s::varchar)', page_size=len(rows))
+
+    commands = [row for row in rows if row[2] is not None]
+    if commands:
+        execute_values(cur, """
+            INSERT INTO bot_daily_command_stats (day, command, uses)
+            SELECT COALESCE(v.ts::date, CURRENT_DATE), v.command, COUNT(*)
+            FROM (VALUES %s) AS v(ts, command)
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+            ON CONFLICT (day, command) DO UPDATE SET uses = bot_daily_command_stats.uses + EXCLUDED.uses
+        """, [(row[0], row[2]) for row in commands], template='(%s::timestamp, %s::varchar)', page_size=len(commands))
+
+
+def notify_live(cur, users=0, messages_in=0, messages_out=0, commands=0, imported=False):
+    """Дельта для живой ленты панели (bot-manage action=live); users — только новые строки bot_users.
+    NOTIFY доставляется только после COMMIT"""
+    payload = {'users': users, 'messagesIn': messages_in, 'messagesOut': messages_out, 'commands': commands}
+    if imported:
+        payload['import'] = True
+    cur.execute("SELECT pg_notify('bot_live', %s)", (json.dumps(payload),))
+
+
+def invalidate_stats(cur):
+    """Сдвигает версию кэша дашборда bot-stats; nextval не транзакционен и не блокирует строк"""
+    cur.execute("SELECT nextval('bot_stats_version_seq')")
+
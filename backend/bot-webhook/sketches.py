@@ -0,0 +1,49 @@
+import hashlib
+from psycopg2.extras import execute_values
+
+REGISTER_HEX = 3
+RANK_BITS = 52
+
+
+def register_rank(telegram_id):
+    """HyperLogLog на 4096 регистров: первые 12 бит md5 — регистр, следующие 52 — ранг (позиция первой единицы).
+    Та же формула в SQL у бэкфилла в V0018"""
+    digest = hashlib.md5(str(telegram_id).encode()).hexdigest()
+    rest = int(digest[REGISTER_HEX:REGISTER_HEX + RANK_BITS // 4], 16)
+    return int(digest[:REGISTER_HEX], 16), RANK_BITS + 1 - rest.bit_length()
+
+
+def record_sketches(cur, rows):
+    """rows — как у record_activity. Исходящие сообщения бота активностью пользователя не считаются.
+    Дневные регистры HLL растут через GREATEST, недели активности пишутся один раз и двигают счётчики когорт"""
+    active = {(row[0], row[1]) for row in rows if row[0] and row[2] in (None, 'in')}
+    if not active:
+        return
+    execute_values(cur, """
+        INSERT INTO bot_activity_sketches (day, register, rank)
+        SELECT COALESCE(v.ts::date, CURRENT_DATE), v.register, MAX(v.rank)
+        FROM (VALUES %s) AS v(register, rank, ts)
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (day, register) DO UPDATE SET rank = EXCLUDED.rank
+        WHERE bot_activity_sketches.rank < EXCLUDED.rank
+    """, [register_rank(tid) + (ts,) for tid, ts in active],
+        template='(%s::smallint, %s::smallint, %s::timestamp)', page_size=len(active))
+
+    execute_values(cur, """
+        WITH v(telegram_id, ts) AS (VALUES %s),
+        fresh AS (
+            INSERT INTO bot_user_active_weeks (telegram_id, week)
+            SELECT DISTINCT v.telegram_id, date_trunc('week', COALESCE(v.ts, NOW()::timestamp))::date FROM v
+            ON CONFLICT (telegram_id, week) DO NOTHING
+            RETURNING telegram_id, week
+        )
+        INSERT INTO bot_retention_cohorts (cohort_week, week_offset, users)
+        SELECT date_trunc('week', u.joined_at)::date, (f.week - date_trunc('week', u.joined_at)::date) / 7, COUNT(*)
+        FROM fresh f
+        JOIN bot_users u ON u.telegram_id = f.telegram_id
+        WHERE f.week >= date_trunc('week', u.joined_at)::date
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (cohort_week, week_offset) DO UPDATE SET users = bot_retention_cohorts.users + EXCLUDED.users
+    """, list(active), template='(%s::bigint, %s::timestamp)', page_size=len(active))
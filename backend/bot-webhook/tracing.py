@@ -0,0 +1,190 @@
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from psycopg2.extensions import cursor as base_cursor
+
+TRACE_LOG = os.environ.get('TRACE_LOG', '1') == '1'
+TRACE_DEBUG = os.environ.get('TRACE_DEBUG', '0') == '1'
+TRACE_LOG_SQL = os.environ.get('TRACE_LOG_SQL', '0') == '1'
+SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '100'))
+MAX_SPANS = 200
+SQL_PREVIEW = 160
+
+_local = threading.local()
+_spaces = re.compile(r'\s+')
+_literal = re.compile(r"'|\$|\bVALUES\b", re.IGNORECASE)
+_number = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+class Trace:
+    """Спаны одного вызова handler: вид (db/http/...), имя, длительность, число строк"""
+
+    def __init__(self, function, action):
+        self.function = function
+        self.action = action
+        self.started = time.perf_counter()
+        self.spans = []
+        self.totals = {}
+        self.tags = {}
+        self.lock = threading.Lock()
+
+    def add(self, kind, name, ms, rows=None):
+        with self.lock:
+            count, total = self.totals.get(kind, (0, 0.0))
+            self.totals[kind] = (count + 1, total + ms)
+            if len(self.spans) < MAX_SPANS:
+                span = {'kind': kind, 'name': name, 'ms': round(ms, 2)}
+                if rows is not None and rows >= 0:
+                    span['rows'] = rows
+                self.spans.append(span)
+
+    def elapsed(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, total_ms):
+        parts = [f'{kind};dur={total:.1f};desc="{count}"' for kind, (count, total) in sorted(self.totals.items())]
+        parts.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(parts)
+
+    def summary(self, total_ms):
+        return {
+            'totalMs': round(total_ms, 2),
+            'byKind': {kind: {'count': count, 'ms': round(total, 2)} for kind, (count, total) in self.totals.items()},
+            'spans': self.spans
+        }
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+def attach(trace):
+    """Привязывает трассу к рабочему потоку (пул отправки рассылки)"""
+    _local.trace = trace
+
+
+def tag(key, value):
+    trace = current()
+    if trace is not None:
+        trace.tags[key] = value
+
+
+def record(kind, name, ms, rows=None):
+    trace = current()
+    if trace is not None:
+        trace.add(kind, name, ms, rows)
+
+
+@contextmanager
+def span(kind, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, name, (time.perf_counter() - started) * 1000)
+
+
+def sql_name(query):
+    """Начало запроса до первой строки-литерала или VALUES, числа заменены на ?. execute_values и mogrify
+    передают SQL с уже подставленными значениями — тексты сообщений и id в трассу и лог не попадают"""
+    if isinstance(query, bytes):
+        query = query[:SQL_PREVIEW * 4].decode('utf-8', 'replace')
+    query = _spaces.sub(' ', str(query)[:SQL_PREVIEW * 4]).strip()
+    literal = _literal.search(query)
+    if literal:
+        query = query[:literal.start()].rstrip()
+    return _number.sub('?', query)[:SQL_PREVIEW]
+
+
+class TracingCursor(base_cursor):
+    """Курсор psycopg2, который пишет каждый execute в текущую трассу"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record('db', sql_name(query), (time.perf_counter() - started) * 1000, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record('db', sql_name(query), (time.perf_counter() - started) * 1000, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record('db', sql_name(sql), (time.perf_counter() - started) * 1000, self.rowcount)
+
+
+def with_timing(response, trace, total_ms, debug):
+    headers = dict(response.get('headers') or {})
+    headers['Server-Timing'] = trace.server_timing(total_ms)
+    exposed = [h for h in headers.get('Access-Control-Expose-Headers', '').split(', ') if h]
+    headers['Access-Control-Expose-Headers'] = ', '.join(exposed + ['Server-Timing'])
+    if not debug:
+        return dict(response, headers=headers)
+    content_type = next((v for k, v in headers.items() if k.lower() == 'content-type'), '')
+    body = response.get('body')
+    if content_type.startswith('application/json') and isinstance(body, str) and body.startswith('{'):
+        payload = json.loads(body)
+        payload['_timing'] = trace.summary(total_ms)
+        return dict(response, headers=headers, body=json.dumps(payload))
+    headers['X-Debug-Timing'] = json.dumps(trace.summary(total_ms))
+    headers['Access-Control-Expose-Headers'] += ', X-Debug-Timing'
+    return dict(response, headers=headers)
+
+
+def log_span(span):
+    """Медленный спан для лога: начало SQL — только при TRACE_LOG_SQL=1"""
+    if TRACE_LOG_SQL or span['kind'] != 'db':
+        return span
+    return {key: value for key, value in span.items() if key != 'name'}
+
+
+def log_trace(trace, status, total_ms, error=None):
+    entry = {
+        'trace': trace.function,
+        'action': trace.action,
+        'status': status,
+        'ms': round(total_ms, 2),
+        'kinds': {kind: {'count': count, 'ms': round(total, 2)} for kind, (count, total) in trace.totals.items()},
+        'slow': [log_span(s) for s in trace.spans if s['ms'] >= SLOW_MS]
+    }
+    entry.update(trace.tags)
+    if error:
+        entry['error'] = error
+    print(json.dumps(entry, ensure_ascii=False), flush=True)
+
+
+def traced(function):
+    """Декоратор handler: трасса на вызов, заголовок Server-Timing, JSON-лог; ?debug=timing — разбивка по запросам в теле"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            params = event.get('queryStringParameters') or {}
+            trace = Trace(function, params.get('action') or event.get('httpMethod'))
+            previous = current()
+            _local.trace = trace
+            try:
+                response = handler(event, context)
+            except Exception as e:
+                if TRACE_LOG:
+                    log_trace(trace, 500, trace.elapsed(), f'{type(e).__name__}: {e}')
+                raise
+            finally:
+                _local.trace = previous
+            total_ms = trace.elapsed()
+            if TRACE_LOG and event.get('httpMethod') != 'OPTIONS':
+                log_trace(trace, response.get('statusCode'), total_ms)
+            return with_timing(response, trace, total_ms, TRACE_DEBUG and params.get('debug') == 'timing')
+        return wrapper
+    return decorate
@@ -0,0 +1,72 @@
+"""Бенчмарк движка рассылки против локальной заглушки Telegram.
+
+Сравнивает старую последовательную отправку (urllib, новое соединение на
+каждое сообщение) с BroadcastSender.
+
+    python bench/broadcast_bench.py --recipients 2000 --latency 40 --limit 0
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'bot-broadcast'))
+
+import telegram_stub
+from sender import BroadcastSender
+
+
+def sequential(url, token, chat_ids, text):
+    sent = failed = 0
+    for chat_id in chat_ids:
+        try:
+            payload = json.dumps({'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'}).encode()
+            req = urllib.request.Request(f'{url}/bot{token}/sendMessage', data=payload, headers={'Content-Type': 'application/json'})
+            urllib.request.urlopen(req, timeout=10)
+            sent += 1
+        except Exception:
+            failed += 1
+    return sent, failed
+
+
+def run(name, fn, count):
+    started = time.perf_counter()
+    sent, failed = fn()
+    elapsed = time.perf_counter() - started
+    result = {'engine': name, 'recipients': count, 'sent': sent, 'failed': failed,
+              'seconds': round(elapsed, 3), 'msgPerSec': round(count / elapsed, 1) if elapsed else None}
+    print(json.dumps(result))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipients', type=int, default=2000)
+    parser.add_argument('--latency', type=int, default=40, help='задержка заглушки, мс')
+    parser.add_argument('--limit', type=int, default=0, help='лимит заглушки, сообщений/с (0 — без лимита)')
+    parser.add_argument('--rate', type=float, default=1000, help='глобальный лимит BroadcastSender, сообщений/с')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--skip-sequential', action='store_true')
+    args = parser.parse_args()
+
+    server, state, url = telegram_stub.start(latency_ms=args.latency, limit=args.limit)
+    chat_ids = list(range(1, args.recipients + 1))
+    token = 'bench'
+    text = 'Benchmark broadcast'
+
+    if not args.skip_sequential:
+        run('sequential', lambda: sequential(url, token, chat_ids, text), len(chat_ids))
+    sender = BroadcastSender(token, workers=args.workers, rate=args.rate, chat_rate=0, api_url=url)
+    def pooled():
+        sent, failures = sender.send(chat_ids, text)
+        return sent, len(failures)
+
+    run('pooled', pooled, len(chat_ids))
+    print(json.dumps({'stub': state.counts}))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Бенчмарк импорта сообщений: построчный цикл INSERT против bulk_import (COPY).
+
+Работает с локальным Postgres из DATABASE_URL. Таблицы создаются во временной
+схеме bench_ingest (LIKE public.*), рабочие данные не затрагиваются.
+
+    DATABASE_URL=postgresql://localhost/bot python bench/ingest_bench.py --rows 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'bot-webhook'))
+
+import psycopg2
+from ingest import bulk_import
+
+
+def synthetic_messages(count, users=1000):
+    start = datetime.utcnow() - timedelta(days=30)
+    for i in range(count):
+        yield {
+            'telegram_id': 100000 + i % users,
+            'direction': 'in' if i % 3 else 'out',
+            'text': f'message {i}',
+            'created_at': (start + timedelta(seconds=i)).isoformat()
+        }
+
+
+def loop_import(conn, cur, messages):
+    started = time.perf_counter()
+    imported = 0
+    for m in messages:
+        cur.execute(
+            "INSERT INTO bot_messages (telegram_id, direction, text, created_at) VALUES (%s, %s, %s, %s)",
+            (m['telegram_id'], m['direction'], m['text'], m['created_at'])
+        )
+        imported += 1
+    conn.commit()
+    return imported, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=5000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute("DROP SCHEMA IF EXISTS bench_ingest CASCADE")
+    cur.execute("CREATE SCHEMA bench_ingest")
+    cur.execute("CREATE TABLE bench_ingest.bot_messages (LIKE public.bot_messages INCLUDING ALL)")
+    cur.execute("SET search_path TO bench_ingest, public")
+    conn.commit()
+
+    results = []
+    try:
+        imported, elapsed = loop_import(conn, cur, synthetic_messages(args.rows))
+        results.append({'engine': 'loop', 'rows': imported, 'seconds': round(elapsed, 3), 'rowsPerSec': round(imported / elapsed)})
+
+        cur.execute("TRUNCATE bot_messages")
+        conn.commit()
+
+        stats = bulk_import(conn, cur, 'import_messages', synthetic_messages(args.rows), batch_size=args.batch)
+        results.append({'engine': 'bulk', 'rows': stats['imported'], 'seconds': round(stats['ms'] / 1000, 3),
+                        'rowsPerSec': stats['rowsPerSec'], 'batches': len(stats['batches'])})
+    finally:
+        conn.rollback()
+        cur.execute("DROP SCHEMA IF EXISTS bench_ingest CASCADE")
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    for result in results:
+        print(json.dumps(result))
+    if len(results) == 2:
+        print(json.dumps({'speedup': round(results[1]['rowsPerSec'] / max(1, results[0]['rowsPerSec']), 1)}))
+
+
+if __name__ == '__main__':
+    main()
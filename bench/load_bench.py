@@ -0,0 +1,297 @@
+"""Нагрузочный прогон всех функций backend/ in-process против локального Postgres.
+
+Каждая функция загружается из своего каталога (у функций одинаковые имена
+модулей — db, cache, ... — поэтому sys.modules изолируется на время импорта),
+handler(event, context) вызывается напрямую из пула потоков. Telegram API
+подменяется заглушкой bench/telegram_stub.py. По каждому сценарию считаются
+p50/p95/p99 задержки и пропускная способность, результат пишется в JSON;
+с --baseline прогон сравнивается с прошлым и завершается кодом 1 при регрессии.
+
+    DATABASE_URL=postgresql://localhost/bot_bench python bench/seed_dataset.py --reset
+    DATABASE_URL=postgresql://localhost/bot_bench python bench/load_bench.py --out bench-results.json
+    DATABASE_URL=... python bench/load_bench.py --baseline bench-results.json --broadcast
+"""
+import argparse
+import importlib.util
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, '..', 'backend')
+sys.path.insert(0, BENCH_DIR)
+
+import psycopg2
+import telegram_stub
+
+SECRET = 'bench-secret'
+BOT_TOKEN = 'bench'
+AUTH_LOGIN = 'bench'
+AUTH_PASSWORD = 'bench-password'
+
+
+class BenchContext:
+    """Контекст вызова облачной функции: бюджет времени для долгих обработчиков (рассылка)"""
+
+    def __init__(self, budget_seconds):
+        self.deadline = time.monotonic() + budget_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+def load_handler(name):
+    """Импортирует backend/<name>/index.py с его собственными соседними модулями"""
+    path = os.path.abspath(os.path.join(BACKEND_DIR, name))
+    local = [f[:-3] for f in os.listdir(path) if f.endswith('.py') and f != 'index.py']
+    for helper in local:
+        sys.modules.pop(helper, None)
+    sys.path.insert(0, path)
+    try:
+        spec = importlib.util.spec_from_file_location(f'bench_{name.replace("-", "_")}', os.path.join(path, 'index.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(path)
+        for helper in local:
+            sys.modules.pop(helper, None)
+    return module.handler
+
+
+def make_event(method='GET', params=None, body=None, headers=None):
+    return {
+        'httpMethod': method,
+        'headers': dict(headers or {}),
+        'queryStringParameters': params or {},
+        'body': json.dumps(body) if body is not None else '',
+        'isBase64Encoded': False
+    }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(handler, name, make, iterations, concurrency, warmup):
+    for i in range(warmup):
+        handler(make(i), None)
+
+    def call(i):
+        started = time.perf_counter()
+        try:
+            status = handler(make(i), None)['statusCode']
+        except Exception:
+            status = 'exception'
+        return (time.perf_counter() - started) * 1000, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(call, range(iterations)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for ms, _ in outcomes)
+    errors = sum(1 for _, status in outcomes if status == 'exception' or status >= 400)
+    return {
+        'scenario': name,
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': errors,
+        'p50': round(percentile(latencies, 50), 2),
+        'p95': round(percentile(latencies, 95), 2),
+        'p99': round(percentile(latencies, 99), 2),
+        'mean': round(sum(latencies) / len(latencies), 2),
+        'max': round(latencies[-1], 2),
+        'rps': round(iterations / elapsed, 1)
+    }
+
+
+def dataset_info(cur):
+    cur.execute("SELECT COUNT(*), COALESCE(MIN(telegram_id), 0), COALESCE(MAX(telegram_id), 0) FROM bot_users")
+    users, min_id, max_id = cur.fetchone()
+    cur.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = 'bot_messages'")
+    row = cur.fetchone()
+    return {'users': users, 'minTelegramId': min_id, 'maxTelegramId': max_id,
+            'messagesEstimate': max(0, row[0]) if row else 0}
+
+
+def auth_token(auth):
+    """Логин стендового владельца; на пустой базе владелец регистрируется"""
+    setup = json.loads(auth(make_event('GET', {'action': 'setup'}), None)['body'])
+    credentials = {'login': AUTH_LOGIN, 'password': AUTH_PASSWORD, 'name': 'Bench'}
+    if not setup.get('hasOwner'):
+        auth(make_event('POST', {'action': 'register_owner'}, credentials), None)
+    response = auth(make_event('POST', {'action': 'login'}, credentials), None)
+    if response['statusCode'] != 200:
+        return None
+    return json.loads(response['body']).get('token')
+
+
+def scenarios(handlers, info, token, rng):
+    low, high = info['minTelegramId'], info['maxTelegramId']
+    secret = {'X-Webhook-Secret': SECRET}
+
+    def user_id():
+        return rng.randint(low, high) if high else rng.randint(1, 1000)
+
+    def batch(size):
+        events = []
+        for _ in range(size):
+            if rng.random() < 0.8:
+                events.append({'type': 'message', 'telegram_id': user_id(), 'direction': 'in', 'text': 'bench message'})
+            else:
+                events.append({'type': 'command', 'telegram_id': user_id(), 'command': '/start'})
+        return events
+
+    webhook, stats, manage = handlers['bot-webhook'], handlers['bot-stats'], handlers['bot-manage']
+    items = [
+        ('webhook.ping', webhook, lambda i: make_event('POST', body={'type': 'ping'}, headers=secret)),
+        ('webhook.message', webhook, lambda i: make_event('POST', body={'type': 'message', 'telegram_id': user_id(), 'text': f'bench {i}'}, headers=secret)),
+        ('webhook.command', webhook, lambda i: make_event('POST', body={'type': 'command', 'telegram_id': user_id(), 'command': '/help'}, headers=secret)),
+        ('webhook.batch100', webhook, lambda i: make_event('POST', body={'type': 'batch', 'events': batch(100)}, headers=secret)),
+        ('stats.dashboard', stats, lambda i: make_event('GET')),
+        ('stats.analytics', stats, lambda i: make_event('GET', {'view': 'analytics'})),
+        ('manage.users', manage, lambda i: make_event('GET', {'action': 'users'})),
+        ('manage.users_search', manage, lambda i: make_event('GET', {'action': 'users', 'search': f'user_{rng.randint(1, 999)}'})),
+        ('manage.logs', manage, lambda i: make_event('GET', {'action': 'logs'})),
+        ('manage.logs_user', manage, lambda i: make_event('GET', {'action': 'logs', 'telegram_id': str(user_id())})),
+        ('manage.logs_search', manage, lambda i: make_event('GET', {'action': 'logs', 'q': 'message'})),
+        ('manage.settings', manage, lambda i: make_event('GET', {'action': 'settings'})),
+        ('manage.settings_since', manage, lambda i: make_event('GET', {'action': 'settings', 'since': '1000000000'})),
+        ('broadcast.history', handlers['bot-broadcast'], lambda i: make_event('GET')),
+    ]
+    if token:
+        items.append(('auth.me', handlers['auth'], lambda i: make_event('GET', {'action': 'me'}, headers={'X-Auth-Token': token})))
+    return items
+
+
+def run_broadcast(broadcast, budget, max_invocations):
+    """Одна рассылка на всю базу: создание и продолжения до done; пропускная способность — сообщений в секунду"""
+    latencies = []
+    started = time.perf_counter()
+    event = make_event('POST', body={'text': 'Benchmark broadcast'})
+    result = {}
+    for _ in range(max_invocations):
+        call_started = time.perf_counter()
+        response = broadcast(event, BenchContext(budget))
+        latencies.append((time.perf_counter() - call_started) * 1000)
+        result = json.loads(response['body'])
+        if response['statusCode'] != 200 or result.get('status') != 'paused':
+            break
+        event = make_event('POST', body={'broadcastId': result['broadcastId']})
+    elapsed = time.perf_counter() - started
+    sent = result.get('sentCount') or 0
+    return {
+        'scenario': 'broadcast.send',
+        'invocations': len(latencies),
+        'status': result.get('status'),
+        'sent': sent,
+        'failed': result.get('failedCount'),
+        'seconds': round(elapsed, 2),
+        'msgPerSec': round(sent / elapsed, 1) if elapsed else None,
+        'invocationMs': [round(ms, 1) for ms in latencies]
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Регрессия — рост p95 или падение rps больше чем на threshold относительно базового прогона"""
+    previous = {r['scenario']: r for r in baseline.get('results', [])}
+    regressions = []
+    for r in results:
+        old = previous.get(r['scenario'])
+        if not old:
+            continue
+        if 'p95' in r and old.get('p95') and r['p95'] > old['p95'] * (1 + threshold):
+            regressions.append({'scenario': r['scenario'], 'metric': 'p95', 'baseline': old['p95'], 'current': r['p95']})
+        for metric in ('rps', 'msgPerSec'):
+            if r.get(metric) and old.get(metric) and r[metric] < old[metric] * (1 - threshold):
+                regressions.append({'scenario': r['scenario'], 'metric': metric, 'baseline': old[metric], 'current': r[metric]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', default='', help='префиксы сценариев через запятую, например webhook,stats')
+    parser.add_argument('--broadcast', action='store_true', help='прогнать рассылку на всю базу через заглушку')
+    parser.add_argument('--broadcast-rate', type=float, default=1000, help='глобальный лимит рассылки, сообщений/с')
+    parser.add_argument('--broadcast-budget', type=float, default=30, help='бюджет одного вызова рассылки, с')
+    parser.add_argument('--stub-latency', type=int, default=20, help='задержка заглушки Telegram, мс')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='bench-results.json')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    server, state, url = telegram_stub.start(latency_ms=args.stub_latency)
+    os.environ.update({
+        'TELEGRAM_API_URL': url,
+        'TELEGRAM_BOT_TOKEN': BOT_TOKEN,
+        'WEBHOOK_SECRET': SECRET,
+        'BROADCAST_RATE': str(args.broadcast_rate),
+        'BROADCAST_CHAT_RATE': '0',
+        'TRACE_LOG': os.environ.get('TRACE_LOG', '0'),
+    })
+    handlers = {name: load_handler(name) for name in ('auth', 'bot-broadcast', 'bot-manage', 'bot-stats', 'bot-webhook')}
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        with conn.cursor() as cur:
+            info = dataset_info(cur)
+    finally:
+        conn.close()
+
+    rng = random.Random(args.seed)
+    prefixes = [p for p in args.only.split(',') if p]
+    token = auth_token(handlers['auth']) if not prefixes or any(p.startswith('auth') for p in prefixes) else None
+    results = []
+    for name, handler, make in scenarios(handlers, info, token, rng):
+        if prefixes and not any(name.startswith(p) for p in prefixes):
+            continue
+        result = run_scenario(handler, name, make, args.iterations, args.concurrency, args.warmup)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    if args.broadcast:
+        result = run_broadcast(handlers['bot-broadcast'], args.broadcast_budget, max_invocations=1000)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+    server.shutdown()
+
+    report = {
+        'startedAt': datetime.utcnow().isoformat(),
+        'revision': git_revision(),
+        'dataset': info,
+        'stub': state.counts,
+        'results': results
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(results, json.load(f), args.threshold)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if report.get('regressions'):
+        print(json.dumps({'regressions': report['regressions']}, ensure_ascii=False))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Синтетический датасет для нагрузочных прогонов: пользователи, сообщения, команды.
+
+Пишет прямо в схему public базы из DATABASE_URL (все миграции должны быть
+применены) — запускать только на локальной/стендовой базе. Данные генерирует
+сам Postgres через generate_series порциями, роллапы пересчитываются целиком.
+
+    DATABASE_URL=postgresql://localhost/bot_bench python bench/seed_dataset.py --reset
+"""
+import argparse
+import json
+import os
+import time
+
+import psycopg2
+
+COMMANDS = ('/start', '/help', '/settings', '/menu', '/stop', '/profile', '/feedback', '/pay')
+TABLES = ('bot_users', 'bot_messages', 'bot_commands_log', 'bot_broadcasts',
+          'bot_daily_stats', 'bot_daily_command_stats',
+          'bot_activity_sketches', 'bot_user_active_weeks', 'bot_retention_cohorts')
+
+
+def reset(conn, cur):
+    cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+    conn.commit()
+
+
+def seed_users(conn, cur, users, days):
+    cur.execute("""
+        INSERT INTO bot_users (telegram_id, username, first_name, last_name, is_blocked, joined_at, last_active_at)
+        SELECT 100000000 + g,
+               CASE WHEN g %% 4 = 0 THEN NULL ELSE 'user_' || g END,
+               'Name' || (g %% 5000),
+               CASE WHEN g %% 3 = 0 THEN 'Last' || (g %% 700) END,
+               g %% 50 = 0,
+               NOW() - make_interval(secs => (%(days)s * 86400.0) * (%(users)s - g) / %(users)s),
+               NOW() - make_interval(secs => random() * %(days)s * 86400)
+        FROM generate_series(1, %(users)s) g
+        ON CONFLICT (telegram_id) DO NOTHING
+    """, {'users': users, 'days': days})
+    conn.commit()
+    cur.execute("UPDATE bot_users SET last_active_at = joined_at WHERE last_active_at < joined_at")
+    conn.commit()
+
+
+def seed_messages(conn, cur, users, messages, days, chunk):
+    """Сообщения равномерно по интервалу days, порциями по chunk строк — каждая порция отдельной транзакцией"""
+    cur.execute(
+        "SELECT bot_ensure_partitions('bot_messages', (NOW() - make_interval(days => %s))::date, CURRENT_DATE)",
+        (days,)
+    )
+    conn.commit()
+    for start in range(0, messages, chunk):
+        cur.execute("""
+            INSERT INTO bot_messages (telegram_id, direction, text, created_at)
+            SELECT 100000000 + 1 + (g * 7919) %% %(users)s,
+                   CASE WHEN g %% 3 = 0 THEN 'out' ELSE 'in' END,
+                   'message ' || g || ' ' || md5(g::text),
+                   NOW() - make_interval(secs => (%(days)s * 86400.0) * (%(total)s - g) / %(total)s)
+            FROM generate_series(%(start)s + 1, %(end)s) g
+        """, {'users': users, 'days': days, 'total': messages, 'start': start, 'end': min(start + chunk, messages)})
+        conn.commit()
+
+
+def seed_commands(conn, cur, users, commands, days):
+    cur.execute(
+        "SELECT bot_ensure_partitions('bot_commands_log', (NOW() - make_interval(days => %s))::date, CURRENT_DATE)",
+        (days,)
+    )
+    cur.execute("""
+        INSERT INTO bot_commands_log (telegram_id, command, created_at)
+        SELECT 100000000 + 1 + (g * 104729) %% %(users)s,
+               (%(commands)s)[1 + g %% %(count)s],
+               NOW() - make_interval(secs => (%(days)s * 86400.0) * (%(total)s - g) / %(total)s)
+        FROM generate_series(1, %(total)s) g
+    """, {'users': users, 'days': days, 'total': commands, 'commands': list(COMMANDS), 'count': len(COMMANDS)})
+    conn.commit()
+
+
+def rebuild_rollups(conn, cur):
+    cur.execute("TRUNCATE bot_daily_stats, bot_daily_command_stats")
+    cur.execute("""
+        INSERT INTO bot_daily_stats (day, messages_in, messages_out)
+        SELECT created_at::date, COUNT(*) FILTER (WHERE direction = 'in'), COUNT(*) FILTER (WHERE direction <> 'in')
+        FROM bot_messages GROUP BY 1
+    """)
+    cur.execute("""
+        INSERT INTO bot_daily_stats (day, commands)
+        SELECT created_at::date, COUNT(*) FROM bot_commands_log GROUP BY 1
+        ON CONFLICT (day) DO UPDATE SET commands = EXCLUDED.commands
+    """)
+    cur.execute("""
+        INSERT INTO bot_daily_command_stats (day, command, uses)
+        SELECT created_at::date, command, COUNT(*) FROM bot_commands_log GROUP BY 1, 2
+    """)
+    cur.execute("SELECT nextval('bot_stats_version_seq')")
+    conn.commit()
+
+
+def rebuild_counters(conn, cur):
+    cur.execute("""
+        UPDATE bot_users u SET messages_in = m.messages_in, messages_out = m.messages_out, last_message_at = m.last_at
+        FROM (
+            SELECT telegram_id, COUNT(*) FILTER (WHERE direction = 'in') AS messages_in,
+                   COUNT(*) FILTER (WHERE direction <> 'in') AS messages_out, MAX(created_at) AS last_at
+            FROM bot_messages GROUP BY telegram_id
+        ) m
+        WHERE u.telegram_id = m.telegram_id
+    """)
+    cur.execute("""
+        UPDATE bot_users u SET commands_count = c.commands
+        FROM (SELECT telegram_id, COUNT(*) AS commands FROM bot_commands_log GROUP BY telegram_id) c
+        WHERE u.telegram_id = c.telegram_id
+    """)
+    conn.commit()
+
+
+def rebuild_sketches(conn, cur):
+    """HLL-регистры по дням и когорты удержания — те же формулы, что в V0018__activity_sketches.sql"""
+    cur.execute("TRUNCATE bot_activity_sketches, bot_user_active_weeks, bot_retention_cohorts")
+    cur.execute("""
+        CREATE TEMPORARY TABLE activity_backfill ON COMMIT DROP AS
+        SELECT DISTINCT telegram_id, created_at::date AS day
+        FROM (
+            SELECT telegram_id, created_at FROM bot_messages WHERE direction = 'in'
+            UNION ALL
+            SELECT telegram_id, created_at FROM bot_commands_log
+        ) a
+    """)
+    cur.execute("""
+        INSERT INTO bot_activity_sketches (day, register, rank)
+        SELECT day,
+               ('x' || substr(h, 1, 3))::bit(12)::int,
+               MAX(53 - length(ltrim(('x' || substr(h, 4, 13))::bit(52)::text, '0')))
+        FROM (SELECT day, md5(telegram_id::text) AS h FROM activity_backfill) s
+        GROUP BY 1, 2
+    """)
+    cur.execute("""
+        INSERT INTO bot_user_active_weeks (telegram_id, week)
+        SELECT DISTINCT telegram_id, date_trunc('week', day)::date FROM activity_backfill
+    """)
+    cur.execute("""
+        INSERT INTO bot_retention_cohorts (cohort_week, week_offset, users)
+        SELECT date_trunc('week', u.joined_at)::date, (w.week - date_trunc('week', u.joined_at)::date) / 7, COUNT(*)
+        FROM bot_user_active_weeks w
+        JOIN bot_users u ON u.telegram_id = w.telegram_id
+        WHERE w.week >= date_trunc('week', u.joined_at)::date
+        GROUP BY 1, 2
+    """)
+    conn.commit()
+
+
+def seed(conn, users, messages, commands, days, chunk=1000000):
+    cur = conn.cursor()
+    timings = {}
+    for name, step in (
+        ('users', lambda: seed_users(conn, cur, users, days)),
+        ('messages', lambda: seed_messages(conn, cur, users, messages, days, chunk)),
+        ('commands', lambda: seed_commands(conn, cur, users, commands, days)),
+        ('rollups', lambda: rebuild_rollups(conn, cur)),
+        ('counters', lambda: rebuild_counters(conn, cur)),
+        ('sketches', lambda: rebuild_sketches(conn, cur)),
+    ):
+        started = time.perf_counter()
+        step()
+        timings[name] = round(time.perf_counter() - started, 1)
+    conn.autocommit = True
+    cur.execute("VACUUM ANALYZE bot_users")
+    cur.execute("VACUUM ANALYZE bot_messages")
+    cur.execute("VACUUM ANALYZE bot_commands_log")
+    conn.autocommit = False
+    cur.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=10000000)
+    parser.add_argument('--commands', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--reset', action='store_true', help='очистить таблицы бота перед генерацией')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        if args.reset:
+            reset(conn, conn.cursor())
+        timings = seed(conn, args.users, args.messages, args.commands, args.days)
+    finally:
+        conn.close()
+    print(json.dumps({'users': args.users, 'messages': args.messages, 'commands': args.commands, 'seconds': timings}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Локальная заглушка api.telegram.org для офлайн-бенчмарков.
+
+Отвечает на sendMessage и getMe, держит keep-alive соединения, имитирует
+задержку сети и глобальный лимит Bot API (429 с retry_after).
+
+    python bench/telegram_stub.py --port 8081 --latency 40 --limit 30
+    TELEGRAM_API_URL=http://127.0.0.1:8081 ...
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, latency_ms=0, limit=0, blocked=()):
+        self.latency = latency_ms / 1000.0
+        self.limit = limit
+        self.blocked = set(blocked)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.counts = {'ok': 0, 'rate_limited': 0, 'forbidden': 0, 'connections': 0}
+
+    def admit(self):
+        if not self.limit:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            return self.window_count <= self.limit
+
+    def bump(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            state.bump('connections')
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_method(self, payload):
+            method = self.path.rsplit('/', 1)[-1].split('?', 1)[0]
+            if state.latency:
+                time.sleep(state.latency)
+            if method == 'getMe':
+                return self.reply(200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}})
+            if method != 'sendMessage':
+                return self.reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            if not state.admit():
+                state.bump('rate_limited')
+                return self.reply(429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1', 'parameters': {'retry_after': 1}})
+            chat_id = payload.get('chat_id')
+            if chat_id in state.blocked:
+                state.bump('forbidden')
+                return self.reply(403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'})
+            state.bump('ok')
+            self.reply(200, {'ok': True, 'result': {'message_id': 1, 'chat': {'id': chat_id}, 'text': payload.get('text', '')}})
+
+        def do_GET(self):
+            self.handle_method({})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b'{}'
+            try:
+                payload = json.loads(raw)
+            except ValueError:
+                payload = {}
+            self.handle_method(payload)
+
+    return Handler
+
+
+def start(port=0, latency_ms=0, limit=0, blocked=()):
+    """Запускает заглушку в фоновом потоке, возвращает (server, state, url)"""
+    state = StubState(latency_ms, limit, blocked)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=int, default=40, help='задержка ответа, мс')
+    parser.add_argument('--limit', type=int, default=30, help='лимит sendMessage в секунду, 0 — без лимита')
+    args = parser.parse_args()
+    server, state, url = start(args.port, args.latency, args.limit)
+    print(f'Telegram stub listening on {url}')
+    try:
+        while True:
+            time.sleep(5)
+            print(json.dumps(state.counts))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
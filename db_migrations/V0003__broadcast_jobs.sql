@@ -0,0 +1,10 @@
+
+ALTER TABLE bot_broadcasts ADD COLUMN total_count INT DEFAULT 0;
+ALTER TABLE bot_broadcasts ADD COLUMN last_telegram_id BIGINT;
+ALTER TABLE bot_broadcasts ADD COLUMN updated_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE bot_broadcasts ADD COLUMN finished_at TIMESTAMP;
+
+UPDATE bot_broadcasts SET status = 'failed', finished_at = NOW() WHERE status = 'sending';
+
+CREATE INDEX idx_bot_broadcasts_status ON bot_broadcasts(status, updated_at);
+CREATE INDEX idx_bot_users_active_recipients ON bot_users(telegram_id) WHERE is_blocked = FALSE;
@@ -0,0 +1,35 @@
+
+CREATE TABLE bot_daily_stats (
+    day DATE PRIMARY KEY,
+    messages_in INT NOT NULL DEFAULT 0,
+    messages_out INT NOT NULL DEFAULT 0,
+    commands INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE bot_daily_command_stats (
+    day DATE NOT NULL,
+    command VARCHAR(255) NOT NULL,
+    uses INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, command)
+);
+
+INSERT INTO bot_daily_stats (day, messages_in, messages_out)
+SELECT date_trunc('day', created_at)::date,
+       COUNT(*) FILTER (WHERE direction = 'in'),
+       COUNT(*) FILTER (WHERE direction <> 'in')
+FROM bot_messages
+GROUP BY 1;
+
+INSERT INTO bot_daily_stats (day, commands)
+SELECT date_trunc('day', created_at)::date, COUNT(*)
+FROM bot_commands_log
+GROUP BY 1
+ON CONFLICT (day) DO UPDATE SET commands = EXCLUDED.commands;
+
+INSERT INTO bot_daily_command_stats (day, command, uses)
+SELECT date_trunc('day', created_at)::date, command, COUNT(*)
+FROM bot_commands_log
+GROUP BY 1, 2;
+
+CREATE INDEX idx_bot_users_joined_at ON bot_users(joined_at);
+CREATE INDEX idx_bot_users_last_active_at ON bot_users(last_active_at);
@@ -0,0 +1,9 @@
+
+CREATE SEQUENCE bot_stats_version_seq;
+
+CREATE UNLOGGED TABLE bot_stats_cache (
+    key VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL,
+    payload TEXT NOT NULL,
+    computed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
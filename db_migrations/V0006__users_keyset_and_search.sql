@@ -0,0 +1,8 @@
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX idx_bot_users_username_trgm ON bot_users USING GIN (username gin_trgm_ops);
+CREATE INDEX idx_bot_users_first_name_trgm ON bot_users USING GIN (first_name gin_trgm_ops);
+
+CREATE INDEX idx_bot_users_joined_at_id ON bot_users (joined_at, id);
+DROP INDEX idx_bot_users_joined_at;
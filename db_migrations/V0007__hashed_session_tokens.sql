@@ -0,0 +1,14 @@
+
+DELETE FROM panel_sessions WHERE expires_at <= NOW();
+
+ALTER TABLE panel_sessions ADD COLUMN token_hash BYTEA;
+UPDATE panel_sessions SET token_hash = sha256(convert_to(token, 'UTF8'));
+ALTER TABLE panel_sessions ALTER COLUMN token_hash SET NOT NULL;
+CREATE UNIQUE INDEX idx_panel_sessions_token_hash ON panel_sessions(token_hash);
+
+DROP INDEX idx_panel_sessions_token;
+ALTER TABLE panel_sessions DROP CONSTRAINT panel_sessions_token_key;
+ALTER TABLE panel_sessions ALTER COLUMN token DROP NOT NULL;
+UPDATE panel_sessions SET token = NULL;
+
+CREATE INDEX idx_panel_sessions_user_id ON panel_sessions(user_id);
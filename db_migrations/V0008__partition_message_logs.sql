@@ -0,0 +1,82 @@
+
+CREATE OR REPLACE FUNCTION bot_ensure_partitions(parent TEXT, from_day DATE, to_day DATE) RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_day)::date;
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    WHILE month_start <= to_day LOOP
+        partition_name := parent || '_' || to_char(month_start, 'YYYYMM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent, month_start, (month_start + INTERVAL '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE bot_messages RENAME TO bot_messages_legacy;
+ALTER INDEX idx_bot_messages_created_at RENAME TO idx_bot_messages_legacy_created_at;
+ALTER TABLE bot_messages_legacy RENAME CONSTRAINT bot_messages_pkey TO bot_messages_legacy_pkey;
+ALTER SEQUENCE bot_messages_id_seq OWNED BY NONE;
+ALTER SEQUENCE bot_messages_id_seq AS BIGINT;
+
+CREATE TABLE bot_messages (
+    id BIGINT NOT NULL DEFAULT nextval('bot_messages_id_seq'),
+    telegram_id BIGINT NOT NULL,
+    direction VARCHAR(10) NOT NULL DEFAULT 'in',
+    text TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE bot_messages_id_seq OWNED BY bot_messages.id;
+CREATE TABLE bot_messages_default PARTITION OF bot_messages DEFAULT;
+
+SELECT bot_ensure_partitions(
+    'bot_messages',
+    COALESCE((SELECT MIN(created_at) FROM bot_messages_legacy), NOW())::date,
+    (NOW() + INTERVAL '3 months')::date
+);
+
+INSERT INTO bot_messages (id, telegram_id, direction, text, created_at)
+SELECT id, telegram_id, direction, text, COALESCE(created_at, NOW())
+FROM bot_messages_legacy;
+
+DROP TABLE bot_messages_legacy;
+CREATE INDEX idx_bot_messages_created_at ON bot_messages(created_at);
+
+ALTER TABLE bot_commands_log RENAME TO bot_commands_log_legacy;
+ALTER INDEX idx_bot_commands_log_created_at RENAME TO idx_bot_commands_log_legacy_created_at;
+ALTER TABLE bot_commands_log_legacy RENAME CONSTRAINT bot_commands_log_pkey TO bot_commands_log_legacy_pkey;
+ALTER SEQUENCE bot_commands_log_id_seq OWNED BY NONE;
+ALTER SEQUENCE bot_commands_log_id_seq AS BIGINT;
+
+CREATE TABLE bot_commands_log (
+    id BIGINT NOT NULL DEFAULT nextval('bot_commands_log_id_seq'),
+    telegram_id BIGINT NOT NULL,
+    command VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE bot_commands_log_id_seq OWNED BY bot_commands_log.id;
+CREATE TABLE bot_commands_log_default PARTITION OF bot_commands_log DEFAULT;
+
+SELECT bot_ensure_partitions(
+    'bot_commands_log',
+    COALESCE((SELECT MIN(created_at) FROM bot_commands_log_legacy), NOW())::date,
+    (NOW() + INTERVAL '3 months')::date
+);
+
+INSERT INTO bot_commands_log (id, telegram_id, command, created_at)
+SELECT id, telegram_id, command, COALESCE(created_at, NOW())
+FROM bot_commands_log_legacy;
+
+DROP TABLE bot_commands_log_legacy;
+CREATE INDEX idx_bot_commands_log_created_at ON bot_commands_log(created_at);
@@ -0,0 +1,7 @@
+
+CREATE INDEX idx_bot_messages_created_at_id ON bot_messages (created_at, id);
+DROP INDEX idx_bot_messages_created_at;
+
+CREATE INDEX idx_bot_messages_telegram_id_created_at ON bot_messages (telegram_id, created_at);
+
+CREATE INDEX idx_bot_messages_text_fts ON bot_messages USING GIN (to_tsvector('simple', COALESCE(text, '')));
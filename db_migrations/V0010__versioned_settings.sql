@@ -0,0 +1,7 @@
+
+CREATE SEQUENCE bot_settings_version_seq;
+
+ALTER TABLE bot_settings ADD COLUMN version BIGINT NOT NULL DEFAULT 0;
+UPDATE bot_settings SET version = nextval('bot_settings_version_seq');
+
+CREATE INDEX idx_bot_settings_version ON bot_settings(version);
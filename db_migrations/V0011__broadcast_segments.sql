@@ -0,0 +1,19 @@
+
+CREATE TABLE bot_segments (
+    id SERIAL PRIMARY KEY,
+    fingerprint CHAR(40) UNIQUE NOT NULL,
+    definition JSONB NOT NULL,
+    member_count INT,
+    materialized_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE bot_segment_members (
+    segment_id INT NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    PRIMARY KEY (segment_id, telegram_id)
+);
+
+ALTER TABLE bot_broadcasts ADD COLUMN segment_id INT;
+
+CREATE INDEX idx_bot_commands_log_command_telegram_id ON bot_commands_log (command, telegram_id);
@@ -0,0 +1,28 @@
+
+ALTER TABLE bot_users
+    ADD COLUMN messages_in INT NOT NULL DEFAULT 0,
+    ADD COLUMN messages_out INT NOT NULL DEFAULT 0,
+    ADD COLUMN commands_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN last_message_at TIMESTAMP;
+
+UPDATE bot_users u SET
+    messages_in = m.messages_in,
+    messages_out = m.messages_out,
+    last_message_at = m.last_message_at
+FROM (
+    SELECT telegram_id,
+           COUNT(*) FILTER (WHERE direction = 'in') AS messages_in,
+           COUNT(*) FILTER (WHERE direction <> 'in') AS messages_out,
+           MAX(created_at) AS last_message_at
+    FROM bot_messages
+    GROUP BY telegram_id
+) m
+WHERE u.telegram_id = m.telegram_id;
+
+UPDATE bot_users u SET commands_count = c.commands
+FROM (SELECT telegram_id, COUNT(*) AS commands FROM bot_commands_log GROUP BY telegram_id) c
+WHERE u.telegram_id = c.telegram_id;
+
+CREATE INDEX idx_bot_commands_log_telegram_id_created_at ON bot_commands_log (telegram_id, created_at);
+CREATE INDEX idx_bot_users_activity ON bot_users ((COALESCE(last_message_at, TIMESTAMP '1970-01-01')), id);
+CREATE INDEX idx_bot_users_messages_in ON bot_users (messages_in, id);
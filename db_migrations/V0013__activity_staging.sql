@@ -0,0 +1,11 @@
+
+CREATE UNLOGGED TABLE bot_activity_staging (
+    telegram_id BIGINT NOT NULL,
+    last_at TIMESTAMP NOT NULL,
+    messages_in INT NOT NULL DEFAULT 0,
+    messages_out INT NOT NULL DEFAULT 0,
+    commands INT NOT NULL DEFAULT 0,
+    last_message_at TIMESTAMP
+);
+
+CREATE INDEX idx_bot_activity_staging_last_at ON bot_activity_staging (last_at);
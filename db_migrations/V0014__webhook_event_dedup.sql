@@ -0,0 +1,7 @@
+
+CREATE TABLE bot_webhook_events (
+    event_id VARCHAR(128) PRIMARY KEY,
+    received_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_bot_webhook_events_received_at ON bot_webhook_events (received_at);
@@ -0,0 +1,22 @@
+
+CREATE TABLE bot_broadcast_queue (
+    broadcast_id INT NOT NULL,
+    range_start BIGINT NOT NULL,
+    range_end BIGINT NOT NULL,
+    recipients INT NOT NULL DEFAULT 0,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    claimed_at TIMESTAMP,
+    sent INT DEFAULT 0,
+    failed INT DEFAULT 0,
+    PRIMARY KEY (broadcast_id, range_start)
+);
+
+CREATE INDEX idx_bot_broadcast_queue_open ON bot_broadcast_queue (broadcast_id, range_start) WHERE status <> 'done';
+
+CREATE TABLE bot_rate_limits (
+    name VARCHAR(64) PRIMARY KEY,
+    rate DOUBLE PRECISION NOT NULL,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL,
+    paused_until TIMESTAMP
+);
@@ -0,0 +1,14 @@
+
+ALTER TABLE bot_users ADD COLUMN unreachable_at TIMESTAMP;
+ALTER TABLE bot_users ADD COLUMN unreachable_reason VARCHAR(16);
+
+CREATE TABLE bot_broadcast_failures (
+    broadcast_id INT NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    reason VARCHAR(16) NOT NULL,
+    error_code SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (broadcast_id, telegram_id)
+);
+
+DROP INDEX idx_bot_users_active_recipients;
+CREATE INDEX idx_bot_users_active_recipients ON bot_users(telegram_id) WHERE is_blocked = FALSE AND unreachable_at IS NULL;
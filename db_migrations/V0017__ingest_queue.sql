@@ -0,0 +1,6 @@
+
+CREATE TABLE bot_ingest_queue (
+    id BIGSERIAL PRIMARY KEY,
+    payload JSONB NOT NULL,
+    received_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
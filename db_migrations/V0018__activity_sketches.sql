@@ -0,0 +1,48 @@
+
+CREATE TABLE bot_activity_sketches (
+    day DATE NOT NULL,
+    register SMALLINT NOT NULL,
+    rank SMALLINT NOT NULL,
+    PRIMARY KEY (day, register)
+);
+
+CREATE TABLE bot_user_active_weeks (
+    telegram_id BIGINT NOT NULL,
+    week DATE NOT NULL,
+    PRIMARY KEY (telegram_id, week)
+);
+
+CREATE TABLE bot_retention_cohorts (
+    cohort_week DATE NOT NULL,
+    week_offset INT NOT NULL,
+    users INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (cohort_week, week_offset)
+);
+
+CREATE TEMPORARY TABLE activity_backfill AS
+SELECT DISTINCT telegram_id, created_at::date AS day
+FROM (
+    SELECT telegram_id, created_at FROM bot_messages WHERE direction = 'in'
+    UNION ALL
+    SELECT telegram_id, created_at FROM bot_commands_log
+) a
+WHERE telegram_id IS NOT NULL;
+
+INSERT INTO bot_activity_sketches (day, register, rank)
+SELECT day,
+       ('x' || substr(h, 1, 3))::bit(12)::int,
+       MAX(53 - length(ltrim(('x' || substr(h, 4, 13))::bit(52)::text, '0')))
+FROM (SELECT day, md5(telegram_id::text) AS h FROM activity_backfill) s
+GROUP BY 1, 2;
+
+INSERT INTO bot_user_active_weeks (telegram_id, week)
+SELECT DISTINCT telegram_id, date_trunc('week', day)::date FROM activity_backfill;
+
+INSERT INTO bot_retention_cohorts (cohort_week, week_offset, users)
+SELECT date_trunc('week', u.joined_at)::date, (w.week - date_trunc('week', u.joined_at)::date) / 7, COUNT(*)
+FROM bot_user_active_weeks w
+JOIN bot_users u ON u.telegram_id = w.telegram_id
+WHERE w.week >= date_trunc('week', u.joined_at)::date
+GROUP BY 1, 2;
+
+DROP TABLE activity_backfill;
@@ -0,0 +1,2 @@
+
+CREATE SEQUENCE panel_sessions_version_seq;
@@ -0,0 +1,37 @@
+
+CREATE OR REPLACE FUNCTION bot_ensure_partitions(parent TEXT, from_day DATE, to_day DATE) RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_day)::date;
+    month_end DATE;
+    partition_name TEXT;
+    default_name TEXT := parent || '_default';
+    has_rows BOOLEAN;
+    created INT := 0;
+BEGIN
+    WHILE month_start <= to_day LOOP
+        partition_name := parent || '_' || to_char(month_start, 'YYYYMM');
+        month_end := (month_start + INTERVAL '1 month')::date;
+        IF to_regclass(partition_name) IS NULL THEN
+            has_rows := FALSE;
+            IF to_regclass(default_name) IS NOT NULL THEN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE created_at >= %L AND created_at < %L)',
+                               default_name, month_start, month_end) INTO has_rows;
+            END IF;
+            IF has_rows THEN
+                EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, default_name);
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_end);
+                EXECUTE format('WITH moved AS (DELETE FROM %I WHERE created_at >= %L AND created_at < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                               default_name, month_start, month_end, parent);
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT', parent, default_name);
+            ELSE
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_end);
+            END IF;
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
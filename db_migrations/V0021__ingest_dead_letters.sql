@@ -0,0 +1,8 @@
+
+CREATE TABLE bot_ingest_dead_letters (
+    id BIGSERIAL PRIMARY KEY,
+    payload JSONB NOT NULL,
+    error TEXT NOT NULL,
+    received_at TIMESTAMP NOT NULL,
+    failed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,2 @@
+
+ALTER TABLE bot_broadcast_queue ADD COLUMN done_through BIGINT;
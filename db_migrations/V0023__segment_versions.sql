@@ -0,0 +1,3 @@
+
+ALTER TABLE bot_segments DROP CONSTRAINT bot_segments_fingerprint_key;
+CREATE INDEX idx_bot_segments_fingerprint ON bot_segments (fingerprint, materialized_at DESC);
@@ -10,6 +10,8 @@ interface Broadcast {
   status?: string;
 }
 
+const MAX_RESUMES = 200;
+
 const BroadcastSection = () => {
   const [text, setText] = useState("");
   const [sending, setSending] = useState(false);
@@ -30,9 +32,18 @@ const BroadcastSection = () => {
     setSending(true);
     setSuccessMsg("");
     try {
-      const result = await api.sendBroadcast(text.trim());
+      let result = await api.sendBroadcast(text.trim());
+      let processed = (result.sentCount || 0) + (result.failedCount || 0);
+      for (let attempt = 0; result.status === "paused" && attempt < MAX_RESUMES; attempt++) {
+        result = await api.resumeBroadcast(result.broadcastId);
+        const next = (result.sentCount || 0) + (result.failedCount || 0);
+        if (next <= processed) break;
+        processed = next;
+      }
       setSuccessMsg(
-        result.message || `Рассылка отправлена: ${result.recipients_count || 0} получателей`
+        result.status === "paused"
+          ? `Рассылка приостановлена: обработано ${processed} из ${result.totalCount || 0}`
+          : result.message || `Рассылка отправлена: ${result.recipients_count || 0} получателей`
       );
       setText("");
       // Refresh list
@@ -70,10 +70,21 @@ export const api = {
 
   getStats: () => fetchJSON(STATS_URL, { headers: authHeaders() }),
 
+  getAnalytics: () => fetchJSON(`${STATS_URL}?view=analytics`, { headers: authHeaders() }),
+
   getBotInfo: () => fetchJSON(`${MANAGE_URL}?action=info`, { headers: authHeaders() }),
 
-  getUsers: (page = 1, search = "") =>
-    fetchJSON(`${MANAGE_URL}?action=users&page=${page}&search=${encodeURIComponent(search)}`, { headers: authHeaders() }),
+  getUsers: (page = 1, search = "", cursor = "", sort: "joined" | "activity" | "messages" = "joined") =>
+    fetchJSON(
+      `${MANAGE_URL}?action=users&page=${page}&search=${encodeURIComponent(search)}&sort=${sort}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""}`,
+      { headers: authHeaders() }
+    ),
+
+  getConversation: (telegramId: number, cursor = "") =>
+    fetchJSON(
+      `${MANAGE_URL}?action=conversation&telegram_id=${telegramId}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""}`,
+      { headers: authHeaders() }
+    ),
 
   blockUser: (telegramId: number, block: boolean) =>
     fetchJSON(`${MANAGE_URL}?action=block_user`, {
@@ -82,6 +93,13 @@ export const api = {
       body: JSON.stringify({ telegramId, block }),
     }),
 
+  bulkBlock: (params: { telegramIds?: number[]; filter?: Record<string, unknown>; block?: boolean; dryRun?: boolean }) =>
+    fetchJSON(`${MANAGE_URL}?action=bulk_block`, {
+      method: "POST",
+      headers: authHeaders(),
+      body: JSON.stringify(params),
+    }),
+
   getSettings: () =>
     fetchJSON(`${MANAGE_URL}?action=settings`, { headers: authHeaders() }),
 
@@ -92,8 +110,11 @@ export const api = {
       body: JSON.stringify(settings),
     }),
 
-  getLogs: () =>
-    fetchJSON(`${MANAGE_URL}?action=logs`, { headers: authHeaders() }),
+  getLogs: (filters: Record<string, string> = {}) =>
+    fetchJSON(`${MANAGE_URL}?${new URLSearchParams({ action: "logs", ...filters })}`, { headers: authHeaders() }),
+
+  getLiveEvents: (cursor?: string, wait = 25) =>
+    fetchJSON(`${MANAGE_URL}?${new URLSearchParams({ action: "live", wait: String(wait), ...(cursor ? { cursor } : {}) })}`, { headers: authHeaders() }),
 
   sendMessage: (chatId: number, text: string) =>
     fetchJSON(`${MANAGE_URL}?action=send_message`, {
@@ -105,11 +126,25 @@ export const api = {
   getBroadcasts: () =>
     fetchJSON(BROADCAST_URL, { headers: authHeaders() }),
 
-  sendBroadcast: (text: string) =>
+  sendBroadcast: (text: string, segment?: Record<string, unknown>) =>
+    fetchJSON(BROADCAST_URL, {
+      method: "POST",
+      headers: authHeaders(),
+      body: JSON.stringify(segment ? { text, segment } : { text }),
+    }),
+
+  previewSegment: (segment: Record<string, unknown>, exact = false) =>
+    fetchJSON(`${BROADCAST_URL}?action=preview`, {
+      method: "POST",
+      headers: authHeaders(),
+      body: JSON.stringify({ segment, exact }),
+    }),
+
+  resumeBroadcast: (broadcastId: number) =>
     fetchJSON(BROADCAST_URL, {
       method: "POST",
       headers: authHeaders(),
-      body: JSON.stringify({ text }),
+      body: JSON.stringify({ broadcastId }),
     }),
 };
 
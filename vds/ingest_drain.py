@@ -0,0 +1,133 @@
+"""Воркер очереди bot_ingest_queue для режима WEBHOOK_MODE=queue.
+
+bot-webhook в этом режиме только проверяет X-Webhook-Secret, кладёт сырые
+события в bot_ingest_queue и отвечает 202. Воркер слушает канал bot_ingest
+(LISTEN/NOTIFY), забирает события пачками по --batch через SKIP LOCKED и
+применяет их тем же apply_batch, что и синхронный вебхук, — модули берутся
+из backend/bot-webhook. Без уведомлений очередь всё равно проверяется раз в
+--idle секунд. Раз в --stats-interval секунд в stdout пишется строка JSON с
+глубиной очереди и задержкой. Раз в час воркер удаляет все устаревшие ключи
+идемпотентности из bot_webhook_events. Ошибка пачки или соединения пишется строкой
+event=error, после паузы --idle воркер переподключается и продолжает;
+события, которые нельзя применить, drain_batch переносит в
+bot_ingest_dead_letters.
+
+    DATABASE_URL=... python vds/ingest_drain.py
+    DATABASE_URL=postgresql://localhost/bot_bench python vds/ingest_drain.py --once
+"""
+import argparse
+import json
+import os
+import select
+import sys
+import time
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+WEBHOOK_DIR = os.environ.get('WEBHOOK_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'bot-webhook')
+sys.path.insert(0, os.path.abspath(WEBHOOK_DIR))
+
+from activity import WRITE_MODE, flush_activity, maybe_flush
+from dedup import purge_due, purge_old
+from ingest_queue import CHANNEL, DRAIN_BATCH, drain_batch, queue_stats
+from rollup import invalidate_stats
+
+
+def log(record):
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
+def drain_all(conn, cur, batch):
+    """Применяет пачки, пока очередь не опустеет; возвращает число применённых событий"""
+    drained = 0
+    while True:
+        result = drain_batch(conn, cur, batch)
+        if result is None:
+            break
+        drained += result['drained']
+        log(dict(result, event='batch'))
+        if result['drained'] < batch:
+            break
+    if drained:
+        maybe_flush(conn, cur)
+        invalidate_stats(cur)
+        conn.commit()
+    return drained
+
+
+def listener(dsn):
+    conn = psycopg2.connect(dsn)
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    conn.cursor().execute(f'LISTEN {CHANNEL}')
+    return conn
+
+
+def reset(conn):
+    """После ошибки: откат, если соединение живо, иначе None — цикл переподключится на следующем шаге"""
+    if conn is None or conn.closed:
+        return None
+    try:
+        conn.rollback()
+        return conn
+    except psycopg2.Error:
+        conn.close()
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch', type=int, default=DRAIN_BATCH)
+    parser.add_argument('--idle', type=float, default=5.0, help='проверка очереди без уведомлений, секунд')
+    parser.add_argument('--stats-interval', type=float, default=60.0)
+    parser.add_argument('--once', action='store_true', help='опустошить очередь и выйти')
+    args = parser.parse_args()
+
+    dsn = os.environ['DATABASE_URL']
+    conn = cur = listen = None
+    next_stats = 0.0
+    try:
+        while True:
+            try:
+                if conn is None:
+                    conn = psycopg2.connect(dsn)
+                    cur = conn.cursor()
+                if listen is None and not args.once:
+                    listen = listener(dsn)
+                drain_all(conn, cur, args.batch)
+                if purge_due():
+                    log({'event': 'purge', 'deleted': purge_old(conn, cur)})
+                if args.once:
+                    break
+                if time.monotonic() >= next_stats:
+                    log(dict(queue_stats(cur), event='stats'))
+                    conn.commit()
+                    next_stats = time.monotonic() + args.stats_interval
+                if select.select([listen], [], [], args.idle)[0]:
+                    listen.poll()
+                    listen.notifies.clear()
+            except Exception as e:
+                log({'event': 'error', 'error': f'{type(e).__name__}: {e}'})
+                conn = reset(conn)
+                if conn is None:
+                    cur = None
+                listen = reset(listen)
+                if args.once:
+                    break
+                time.sleep(args.idle)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if conn is not None and not conn.closed:
+            conn.rollback()
+            if WRITE_MODE != 'direct':
+                flush_activity(conn, cur)
+            log(dict(queue_stats(cur), event='stats'))
+            cur.close()
+            conn.close()
+        if listen is not None:
+            listen.close()
+
+
+if __name__ == '__main__':
+    main()
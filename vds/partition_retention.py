@@ -0,0 +1,132 @@
+"""Обслуживание помесячных партиций bot_messages и bot_commands_log.
+
+Создаёт партиции на несколько месяцев вперёд, а партиции старше срока хранения
+отсоединяет, выгружает в <archive-dir>/<partition>.csv.gz и удаляет. Строки,
+попавшие в DEFAULT-партицию (ts клиента за горизонтом, старый импорт, пропуск
+cron), переносятся в созданные для их месяцев партиции, остаток попадает в отчёт. Дневные
+роллапы (bot_daily_stats) не трогаются — дашборд продолжает видеть историю.
+
+Запускать по cron раз в сутки:
+
+    DATABASE_URL=... python vds/partition_retention.py --retention-months 12 --archive-dir /var/backups/bot
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+from datetime import date
+
+import psycopg2
+
+TABLES = ('bot_messages', 'bot_commands_log')
+PARTITION_RE = re.compile(r'_(\d{4})(\d{2})$')
+
+
+def months_back(day, months):
+    index = day.year * 12 + day.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(conn, cur, table, months_ahead):
+    cur.execute(
+        "SELECT bot_ensure_partitions(%s, CURRENT_DATE, (CURRENT_DATE + make_interval(months => %s))::date)",
+        (table, months_ahead)
+    )
+    created = cur.fetchone()[0]
+    conn.commit()
+    return created
+
+
+def drain_default(conn, cur, table):
+    """Создаёт партиции для месяцев, чьи строки лежат в <table>_default; bot_ensure_partitions переносит их туда"""
+    cur.execute(f"""SELECT DISTINCT date_trunc('month', created_at)::date FROM "{table}_default" ORDER BY 1""")
+    created = 0
+    for (month,) in cur.fetchall():
+        cur.execute("SELECT bot_ensure_partitions(%s, %s, %s)", (table, month, month))
+        created += cur.fetchone()[0]
+    conn.commit()
+    return created
+
+
+def default_report(cur, table):
+    cur.execute(f'SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM "{table}_default"')
+    rows, oldest, newest = cur.fetchone()
+    return {'rows': rows, 'oldest': oldest.isoformat() if oldest else None, 'newest': newest.isoformat() if newest else None}
+
+
+def list_partitions(cur, table):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+    """, (table,))
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_RE.search(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return partitions
+
+
+def archive_partition(conn, cur, table, name, archive_dir):
+    """Отсоединяет партицию, пишет её в gzip CSV и удаляет только после сверки числа строк"""
+    cur.execute(f'ALTER TABLE {table} DETACH PARTITION "{name}"')
+    conn.commit()
+
+    cur.execute(f'SELECT COUNT(*) FROM "{name}"')
+    expected = cur.fetchone()[0]
+
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as out:
+        cur.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', out)
+
+    with gzip.open(path, 'rt', encoding='utf-8') as check:
+        written = sum(1 for _ in csv.reader(check)) - 1
+    if written != expected:
+        raise RuntimeError(f'{name}: archived {written} rows of {expected}, partition kept detached')
+
+    cur.execute(f'DROP TABLE "{name}"')
+    conn.commit()
+    return {'partition': name, 'rows': expected, 'file': path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--retention-months', type=int, default=int(os.environ.get('MESSAGES_RETENTION_MONTHS', '12')))
+    parser.add_argument('--months-ahead', type=int, default=3)
+    parser.add_argument('--archive-dir', default=os.environ.get('MESSAGES_ARCHIVE_DIR', 'archive'))
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    os.makedirs(args.archive_dir, exist_ok=True)
+    cutoff = months_back(date.today(), args.retention_months)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    report = {'cutoff': cutoff.isoformat(), 'created': {}, 'drained': {}, 'default': {}, 'archived': []}
+    try:
+        for table in TABLES:
+            if not args.dry_run:
+                report['drained'][table] = drain_default(conn, cur, table)
+                report['created'][table] = ensure_partitions(conn, cur, table, args.months_ahead)
+            report['default'][table] = default_report(cur, table)
+            for name, month in list_partitions(cur, table):
+                if month >= cutoff:
+                    continue
+                if args.dry_run:
+                    report['archived'].append({'partition': name, 'dryRun': True})
+                    continue
+                report['archived'].append(archive_partition(conn, cur, table, name, args.archive_dir))
+    finally:
+        cur.close()
+        conn.close()
+
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
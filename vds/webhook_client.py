@@ -0,0 +1,121 @@
+"""Клиент bot-webhook для бота на VDS: копит события и отправляет их пачками.
+
+Пачка уходит как {"type": "batch", "events": [...]}, когда набралось
+max_events событий или самое старое ждёт дольше max_age секунд. Каждому
+событию без update_id/event_id присваивается event_id, поэтому повтор пачки
+после таймаута не создаёт дублей. Пачка, на которую сервер ответил 4xx
+(кроме 408 и 429), не повторяется: она уходит в dead_letters, чтобы одно
+некорректное событие не держало буфер.
+
+    client = WebhookBuffer(WEBHOOK_URL, WEBHOOK_SECRET)
+    client.add({'type': 'message', 'telegram_id': 42, 'text': 'hi', 'ts': update.message.date})
+    ...
+    client.close()
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+
+RETRYABLE_STATUS = (408, 429)
+
+
+class WebhookBuffer:
+    def __init__(self, url, secret, max_events=200, max_age=1.0, timeout=10, max_pending=50000):
+        self.url = url
+        self.secret = secret
+        self.max_events = max_events
+        self.max_age = max_age
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.events = []
+        self.oldest = None
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.dropped = 0
+        self.dead_letters = deque(maxlen=100)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, event):
+        if 'ts' not in event and 'date' not in event:
+            event = dict(event, ts=time.time())
+        if 'event_id' not in event and 'update_id' not in event:
+            event = dict(event, event_id=uuid.uuid4().hex)
+        with self.lock:
+            if len(self.events) >= self.max_pending:
+                self.events.pop(0)
+                self.dropped += 1
+            if not self.events:
+                self.oldest = time.monotonic()
+            self.events.append(event)
+            full = len(self.events) >= self.max_events
+        if full:
+            self.wakeup.set()
+
+    def take(self):
+        with self.lock:
+            batch = self.events[:self.max_events]
+            self.events = self.events[self.max_events:]
+            self.oldest = time.monotonic() if self.events else None
+        return batch
+
+    def requeue(self, batch):
+        with self.lock:
+            self.events = batch + self.events
+            self.oldest = self.oldest or time.monotonic()
+
+    def post(self, batch):
+        payload = json.dumps({'type': 'batch', 'events': batch}).encode()
+        req = urllib.request.Request(self.url, data=payload, headers={
+            'Content-Type': 'application/json',
+            'X-Webhook-Secret': self.secret
+        })
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read())
+
+    def flush(self):
+        """Отправляет всё накопленное; при сетевой ошибке или 5xx события возвращаются в буфер,
+        при 4xx пачка откладывается в dead_letters как (HTTP-код, ответ, события)"""
+        with self.send_lock:
+            while True:
+                batch = self.take()
+                if not batch:
+                    return True
+                try:
+                    self.post(batch)
+                except urllib.error.HTTPError as e:
+                    if 400 <= e.code < 500 and e.code not in RETRYABLE_STATUS:
+                        self.dead_letters.append((e.code, e.read().decode('utf-8', 'replace'), batch))
+                        self.dropped += len(batch)
+                        continue
+                    self.requeue(batch)
+                    return False
+                except Exception:
+                    self.requeue(batch)
+                    return False
+
+    def due(self):
+        with self.lock:
+            if not self.events:
+                return False
+            return len(self.events) >= self.max_events or time.monotonic() - self.oldest >= self.max_age
+
+    def run(self):
+        backoff = 0.0
+        while not self.closed:
+            self.wakeup.wait(backoff or min(self.max_age, 0.25))
+            self.wakeup.clear()
+            if self.due():
+                backoff = 0.0 if self.flush() else min(30.0, (backoff or 0.5) * 2)
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join(timeout=self.timeout)
+        self.flush()